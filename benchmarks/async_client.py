@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Fan-out workloads on the thread pool of NTV vs. AsyncNTV
+
+Loads a whole archive (one request per 100 issues) and resolves a batch
+of video infos without a cache, with the same concurrency limit for
+both clients. AsyncNTV is run on aiohttp when it is installed and on
+the executor fallback otherwise or with --executor.
+
+Usage: python -m benchmarks.async_client [--latency 0.05] [--executor]
+
+Python 3 only.
+"""
+
+from __future__ import print_function, unicode_literals
+import time
+import asyncio
+import argparse
+
+from benchmarks.stub import StubData, StubServer
+
+import resources.lib.ntv as ntv
+from resources.lib import asyncntv
+
+
+def timed(func):
+    start = time.time()
+    func()
+    return time.time() - start
+
+
+def run_async(params, method, *args):
+
+    async def main():
+        async with asyncntv.AsyncNTV(params) as api:
+            result = await getattr(api, method)(*args)
+            if isinstance(result, dict):
+                list(result['list'])
+
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NTV vs. AsyncNTV')
+    parser.add_argument('--latency', type=float, default=0.05, help='stub response latency, seconds')
+    parser.add_argument('--pages', type=int, default=20, help='archive pages')
+    parser.add_argument('--ids', type=int, default=100, help='video ids per batch')
+    parser.add_argument('--executor', action='store_true', help='do not use aiohttp')
+    args = parser.parse_args()
+
+    if args.executor:
+        asyncntv.aiohttp = None
+    transport = 'aiohttp' if asyncntv.aiohttp is not None else 'executor'
+
+    server = StubServer(StubData(issues=args.pages * 100), args.latency).start()
+    video_ids = list(range(1, args.ids + 1))
+
+    print('latency {0:.0f} ms, {1} archive pages, {2} video ids, AsyncNTV on {3}'.format(
+        args.latency * 1000, args.pages, args.ids, transport))
+    print('{0:>8} {1:>12} {2:>12} {3:>12} {4:>12}'.format('workers', 'episodes', 'async', 'video infos', 'async'))
+
+    try:
+        for workers in (4, 8, 16):
+            params = {'api_url': server.api_url,
+                      'workers': workers,
+                      'pool_size': workers,
+                      'async_batch': False,
+                      }
+            sync_api = ntv.NTV(params)
+
+            timings = [timed(lambda: list(sync_api.browse_episodes('prog', 1)['list'])),
+                       timed(lambda: run_async(params, 'browse_episodes', 'prog', 1)),
+                       timed(lambda: sync_api.get_video_infos(video_ids)),
+                       timed(lambda: run_async(params, 'get_video_infos', video_ids)),
+                       ]
+            print('{0:>8} {1}'.format(workers, ' '.join('{0:>10.3f} s'.format(t) for t in timings)))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
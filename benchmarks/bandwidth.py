@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Bytes transferred vs. decoded for a typical browse session
+
+The session is run three times against the stub: with an empty cache,
+with the cache forced to revalidate (unchanged data, answered by 304)
+and without a cache at all.
+
+Usage: python -m benchmarks.bandwidth [--issues 2000]
+"""
+
+from __future__ import print_function, unicode_literals
+import shutil
+import argparse
+import tempfile
+
+from benchmarks.stub import StubData, StubServer
+
+import resources.lib.ntv as ntv
+
+
+def browse(api):
+    list(api.get_genres())
+    list(api.browse_programs(1, {'limit': 20})['list'])
+    list(api.browse_seasons('prog_1_1')['list'])
+    list(api.browse_episodes('prog_1_1', 1, {'stream': True})['list'])
+    api.get_video_infos(range(1, 11))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NTV bandwidth benchmark')
+    parser.add_argument('--issues', type=int, default=2000, help='issues per archive')
+    args = parser.parse_args()
+
+    server = StubServer(StubData(issues=args.issues)).start()
+    cache_dir = tempfile.mkdtemp()
+
+    sessions = [('empty cache', {'cache_dir': cache_dir}),
+                ('revalidate', {'cache_dir': cache_dir, 'refresh': True}),
+                ('no cache', {}),
+                ]
+
+    print('{0:<14} {1:<8} {2:>6} {3:>6} {4:>12} {5:>12}'.format('session', 'action', 'reqs', 'hits',
+                                                                'decoded KiB', 'wire KiB'))
+    try:
+        for name, params in sessions:
+            api = ntv.NTV(dict(params, api_url=server.api_url, stream_json=True))
+            del server.requests[:]
+            browse(api)
+
+            for action, stats in sorted(api.profiler.get_stats().items()):
+                print('{0:<14} {1:<8} {2:>6} {3:>6} {4:>12.1f} {5:>12.1f}'.format(
+                    name, action, stats['requests'], stats['cache_hits'],
+                    stats['bytes'] / 1024.0, stats['wire_bytes'] / 1024.0))
+            print('{0:<14} {1} upstream requests'.format('', len(server.requests)))
+    finally:
+        server.stop()
+        shutil.rmtree(cache_dir, True)
+
+
+if __name__ == '__main__':
+    main()
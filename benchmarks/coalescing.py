@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Upstream requests of concurrent plugin processes sharing a cache
+
+Starts several processes at once, like Kodi does for a listing, its
+widgets and the play resolver, each opening the same views with an
+empty shared cache. Compared with lock_timeout=0, where processes do
+not wait for each other.
+
+Usage: python -m benchmarks.coalescing [--processes 6] [--latency 0.3]
+"""
+
+from __future__ import print_function, unicode_literals
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+
+from benchmarks.stub import StubData, StubServer
+
+import resources.lib.ntv as ntv
+
+
+def open_views(args):
+    params, start_at = args
+    time.sleep(max(0, start_at - time.time()))
+
+    api = ntv.NTV(params)
+    start = time.time()
+    list(api.get_genres())
+    list(api.browse_seasons('prog_1_1')['list'])
+    list(api.browse_episodes('prog_1_1', 1)['list'])
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NTV cross-process coalescing')
+    parser.add_argument('--processes', type=int, default=6)
+    parser.add_argument('--latency', type=float, default=0.3, help='stub response latency, seconds')
+    args = parser.parse_args()
+
+    server = StubServer(StubData(issues=300), args.latency).start()
+    pool = multiprocessing.Pool(args.processes)
+
+    print('{0} processes, latency {1:.0f} ms'.format(args.processes, args.latency * 1000))
+    print('{0:<14} {1:>10} {2:>12}'.format('mode', 'requests', 'slowest s'))
+    try:
+        for name, lock_timeout in (('independent', 0), ('single flight', 20)):
+            cache_dir = tempfile.mkdtemp()
+            params = {'api_url': server.api_url,
+                      'cache_dir': cache_dir,
+                      'lock_timeout': lock_timeout,
+                      }
+            del server.requests[:]
+            start_at = time.time() + 0.5
+            timings = pool.map(open_views, [(params, start_at)] * args.processes)
+            print('{0:<14} {1:>10} {2:>12.3f}'.format(name, len(server.requests), max(timings)))
+            shutil.rmtree(cache_dir, True)
+    finally:
+        pool.close()
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Wall time of NTV.browse_episodes vs. archive page count
+
+Usage: python -m benchmarks.episodes [latency_seconds]
+"""
+
+from __future__ import print_function, unicode_literals
+import sys
+import time
+
+from benchmarks.stub import StubData, StubServer
+
+import resources.lib.ntv as ntv
+
+
+def run(latency=0.05, page_counts=(1, 2, 5, 10, 20), workers=(1, 4, 8)):
+    print('latency: {0:.0f} ms'.format(latency * 1000))
+    print('{0:>6} {1}'.format('pages', ' '.join('{0:>12}'.format('workers={0}'.format(w)) for w in workers)))
+
+    for pages in page_counts:
+        server = StubServer(StubData(issues=pages * 100), latency).start()
+
+        timings = []
+        for worker_count in workers:
+            api = ntv.NTV({'api_url': server.api_url,
+                           'workers': worker_count,
+                           'keep_session': False,
+                           })
+            start = time.time()
+            result = api.browse_episodes('prog', 1)
+            items = list(result['list'])
+            timings.append(time.time() - start)
+            assert len(items) == pages * 100
+
+        server.stop()
+        print('{0:>6} {1}'.format(pages, ' '.join('{0:>10.3f} s'.format(t) for t in timings)))
+
+
+if __name__ == '__main__':
+    run(float(sys.argv[1]) if len(sys.argv) > 1 else 0.05)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Per-item cost of rating conversion: if/elif ladder vs. shared lookup
+
+Usage: python -m benchmarks.ratings [item_count]
+"""
+
+from __future__ import print_function, unicode_literals
+import sys
+import gc
+import timeit
+import tracemalloc
+
+from benchmarks.stub import make_rating
+
+from resources.lib.ntv import NTV
+
+
+def _ladder_rating(rating):
+    # Conversion used before the lookup table
+    rars = rating['v']
+    if rating['k'] <= 0:
+        mpaa = 'G'
+        rars = '0+'
+    elif rating['k'] == 1:
+        mpaa = 'PG'
+    elif rating['k'] == 2:
+        mpaa = 'PG-13'
+    elif rating['k'] == 3:
+        mpaa = 'R'
+    elif rating['k'] == 4:
+        mpaa = 'NC-17'
+    else:
+        mpaa = ''
+
+    return {'rars': rars,
+            'mpaa': mpaa,
+            }
+
+
+def run(item_count=10000):
+    ratings = [make_rating(i) for i in range(item_count)]
+
+    print('{0} items'.format(item_count))
+    for name, convert in (('ladder', _ladder_rating), ('lookup', NTV._get_rating)):
+        elapsed = min(timeit.repeat(lambda: [convert(r) for r in ratings], number=10, repeat=3)) / 10
+
+        gc.collect()
+        tracemalloc.start()
+        result = [convert(r) for r in ratings]
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del result
+
+        print('{0:>8}: {1:>8.1f} ns/item {2:>8.1f} B/item'.format(name, elapsed * 1e9 / item_count,
+                                                               float(size) / item_count))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Memory of episode items: plain dicts vs. slotted records
+
+Usage: python -m benchmarks.records [issue_count]
+"""
+
+from __future__ import print_function, unicode_literals
+import sys
+import gc
+import time
+import tracemalloc
+
+from benchmarks.stub import make_issue
+
+from resources.lib.ntv import NTV
+
+
+def _dict_rating(rating):
+    return {'rars': rating['v'],
+            'mpaa': 'PG',
+            }
+
+
+def _dict_item(issue, video, part=None):
+    # Item layout used before the record types
+    return {'program_title': issue.get('program_title', ''),
+            'title': issue.get('title', ''),
+            'description': issue.get('txt', ''),
+            'rating': _dict_rating(video['r']),
+            'allowed': video['allowed'],
+            'img': video['img'],
+            'id': video['id'],
+            'timestamp': float(video['ts']) / 1000,
+            'duration': video['tt'],
+            'subtitles': video.get('subtitles'),
+            'episode': None,
+            'season': None,
+            'genre': None,
+            'part': part,
+            }
+
+
+def measure(build, issues):
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    items = [build(issue, issue['video_list'][0]) for issue in issues]
+    elapsed = time.time() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del items
+    return size, elapsed
+
+
+def run(issue_count=10000):
+    issues = [make_issue('prog', i) for i in range(issue_count)]
+
+    print('{0} episodes'.format(issue_count))
+    for name, build in (('dict', _dict_item), ('record', NTV._video_item)):
+        size, elapsed = measure(build, issues)
+        print('{0:>8}: {1:>8.1f} KiB {2:>8.1f} B/item {3:>8.3f} s'.format(name, size / 1024.0,
+                                                                        float(size) / issue_count, elapsed))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Size and load time of cached data: raw JSON vs. snapshots
+
+The archive is stored the way the local archive store keeps it, the
+catalog the way the main document is cached. Load time is the best of
+several runs of decoding the stored bytes.
+
+Usage: python -m benchmarks.snapshot [issue_count] [--repeat 10]
+"""
+
+from __future__ import print_function, unicode_literals
+import json
+import time
+import argparse
+
+from benchmarks.stub import StubData, make_issue
+
+from resources.lib import snapshot
+
+
+def best_time(func, repeat):
+    result = None
+    for i in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if result is None \
+          or elapsed < result:
+            result = elapsed
+    return result
+
+
+def measure(name, raw, projected, repeat):
+    raw_bytes = json.dumps(raw).encode('utf-8')
+    snapshot_bytes = snapshot.dumps(projected)
+    assert snapshot.loads(snapshot_bytes) == projected
+
+    json_time = best_time(lambda: json.loads(raw_bytes.decode('utf-8')), repeat)
+    snapshot_time = best_time(lambda: snapshot.loads(snapshot_bytes), repeat)
+
+    print('{0:<22} {1:>10.1f} {2:>10.1f} {3:>10.2f} {4:>10.2f} {5:>8.1f}x'.format(
+        name, len(raw_bytes) / 1024.0, len(snapshot_bytes) / 1024.0,
+        json_time * 1000, snapshot_time * 1000, json_time / snapshot_time))
+
+
+def run(issue_count=10000, repeat=10):
+    issues = [make_issue('prog', i) for i in range(issue_count)]
+    archive = {'issue_count': issue_count,
+               'issues': issues,
+               }
+    catalog = StubData().main()['data']
+
+    print('schema version {0}, best of {1} runs'.format(snapshot.SCHEMA_VERSION, repeat))
+    print('{0:<22} {1:>10} {2:>10} {3:>10} {4:>10} {5:>9}'.format(
+        'data', 'json KiB', 'snap KiB', 'json ms', 'snap ms', 'speedup'))
+    measure('archive [{0} issues]'.format(issue_count), archive,
+            {'issue_count': issue_count, 'issues': snapshot.project_issues(issues)}, repeat)
+    measure('catalog', catalog, snapshot.project_catalog(catalog), repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NTV snapshot benchmark')
+    parser.add_argument('issue_count', type=int, nargs='?', default=10000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    run(args.issue_count, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
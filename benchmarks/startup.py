@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Per-invocation startup cost of the plugin
+
+Kodi starts a new interpreter for every click, so every route pays for
+its imports. Each scenario runs in a fresh interpreter and reports the
+time spent after interpreter startup (imports + dispatch) as well as the
+total wall time, and whether ``requests`` got imported at all.
+
+Usage: python -m benchmarks.startup [--repeat 10]
+
+Route scenarios need the Kodi stubs and script.module.simplemedia set up
+the same way as for tests.py, otherwise they are skipped.
+"""
+
+from __future__ import print_function, unicode_literals
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.stub import StubData, StubServer, addon_dir
+
+import resources.lib.ntv as ntv
+
+cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_prologue = '''
+import sys, time, json
+_start = time.time()
+sys.path.insert(0, {addon_dir!r})
+'''
+
+_epilogue = '''
+print(json.dumps({{'elapsed': time.time() - _start, 'requests': 'requests' in sys.modules}}))
+'''
+
+_import_ntv = '''
+import resources.lib.ntv as ntv
+'''
+
+_cached_genres = '''
+import resources.lib.ntv as ntv
+api = ntv.NTV({{'api_url': {api_url!r}, 'cache_dir': {cache_dir!r}, 'stream_json': True}})
+list(api.get_genres())
+'''
+
+_route = '''
+import os, runpy, mock, xbmcaddon
+xbmcaddon.init_addon(os.path.join({cwd!r}, 'script.module.simplemedia'),
+                     os.path.join({temp_dir!r}, 'script.module.simplemedia'))
+xbmcaddon.init_addon({addon_dir!r}, os.path.join({temp_dir!r}, 'plugin.video.ntv.ru'), True)
+import resources.lib.ntv as ntv
+
+class StubNTV(ntv.NTV):
+    def __init__(self, params=None):
+        params = dict(params or {{}})
+        params['api_url'] = {api_url!r}
+        super(StubNTV, self).__init__(params)
+
+with mock.patch('simpleplugin.sys.argv', [{url!r}, '1', '']), \\
+  mock.patch.object(ntv, 'NTV', StubNTV):
+    runpy.run_path(os.path.join({addon_dir!r}, 'default.py'), run_name='__main__')
+'''
+
+
+def run_child(code, repeat, **context):
+    context.setdefault('addon_dir', addon_dir)
+    script = (_prologue + code + _epilogue).format(**context)
+
+    inner = []
+    total = []
+    uses_requests = False
+    for i in range(repeat):
+        start = time.time()
+        output = subprocess.check_output([sys.executable, '-c', script], cwd=cwd)
+        total.append(time.time() - start)
+
+        result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        inner.append(result['elapsed'])
+        uses_requests = uses_requests or result['requests']
+
+    return min(inner), min(total), uses_requests
+
+
+def has_kodi_stubs():
+    try:
+        import mock
+        import xbmcaddon
+        import simplemedia
+    except ImportError:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NTV plugin startup benchmark')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    server = StubServer(StubData(), 0).start()
+    cache_dir = tempfile.mkdtemp()
+    temp_dir = tempfile.mkdtemp()
+
+    # Warm the cache the scenarios read from
+    list(ntv.NTV({'api_url': server.api_url, 'cache_dir': cache_dir, 'stream_json': True}).get_genres())
+
+    scenarios = [('import ntv', _import_ntv, {}),
+                 ('get_genres [cached]', _cached_genres, {'cache_dir': cache_dir}),
+                 ]
+    if has_kodi_stubs():
+        for name, path in (('root', '/'),
+                           ('genre', '/genre/Genre 1'),
+                           ('program_seasons', '/seasons/prog_1_1'),
+                           ('program_episodes', '/episodes/prog_1_1/1'),
+                           ('play_video', '/video/5'),
+                           ):
+            url = 'plugin://plugin.video.ntv.ru{0}'.format(path)
+            scenarios.append(('route {0}'.format(name), _route, {'url': url, 'temp_dir': temp_dir}))
+    else:
+        print('Route scenarios skipped: Kodi stubs or simplemedia are not installed')
+
+    print('best of {0} runs'.format(args.repeat))
+    print('{0:<28} {1:>10} {2:>10} {3:>9}'.format('scenario', 'inner ms', 'total ms', 'requests'))
+    try:
+        for name, code, context in scenarios:
+            inner, total, uses_requests = run_child(code, args.repeat, api_url=server.api_url, cwd=cwd, **context)
+            print('{0:<28} {1:>10.1f} {2:>10.1f} {3:>9}'.format(name, inner * 1000, total * 1000,
+                                                              'yes' if uses_requests else 'no'))
+    finally:
+        server.stop()
+        shutil.rmtree(cache_dir, True)
+        shutil.rmtree(temp_dir, True)
+
+
+if __name__ == '__main__':
+    main()
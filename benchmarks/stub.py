@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""Local stand-in for the NTV mobile API used by the benchmarks"""
+
+from __future__ import print_function, unicode_literals
+import io
+import os
+import sys
+import gzip
+import json
+import time
+import hashlib
+import threading
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+cwd = os.path.dirname(os.path.abspath(__file__))
+addon_dir = os.path.join(os.path.dirname(cwd), 'plugin.video.ntv.ru')
+
+if addon_dir not in sys.path:
+    sys.path.append(addon_dir)
+
+API_PATH = '/m/v10'
+TS_START = 1500000000000
+
+
+def make_rating(index):
+    return {'k': index % 5, 'v': '{0}+'.format((index % 5) * 6)}
+
+
+def make_video(video_id, ts):
+    return {'id': video_id,
+            'r': make_rating(video_id),
+            'allowed': True,
+            'img': 'http://www.ntv.ru/images/{0}.jpg'.format(video_id),
+            'ts': ts,
+            'tt': 2400,
+            'subtitles': None,
+            'video': 'http://media.ntv.ru/{0}.mp4'.format(video_id),
+            'hi_video': 'http://media.ntv.ru/{0}_hi.mp4'.format(video_id),
+            'comScore': {'ns_st_en': '*null', 'ns_st_sn': '*null', 'ns_st_ge': 'show'},
+            }
+
+
+def make_issue(prog_id, index):
+    ts = TS_START + index * 86400000
+    return {'title': 'Issue {0}'.format(index),
+            'txt': 'Description of issue {0} of {1}'.format(index, prog_id),
+            'program_title': 'Program {0}'.format(prog_id),
+            'ts': ts,
+            'video_list': [make_video(index + 1, ts)],
+            }
+
+
+def make_program(genre_id, index):
+    shortcat = 'prog_{0}_{1}'.format(genre_id, index)
+    return {'id': genre_id * 1000 + index,
+            'shortcat': shortcat,
+            'title': 'Program {0}'.format(shortcat),
+            'annotation': 'Annotation of {0}'.format(shortcat),
+            'img': 'http://www.ntv.ru/images/{0}.jpg'.format(shortcat),
+            'r': make_rating(index),
+            }
+
+
+def gzip_bytes(data):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+class StubData(object):
+
+    def __init__(self, genres=10, programs=50, issues=1000, newest_first=True):
+        self.genres = genres
+        self.programs = programs
+        self.issues = issues
+        self.newest_first = newest_first
+
+    def main(self):
+        genres = []
+        for genre_id in range(self.genres):
+            genres.append({'title': 'Genre {0}'.format(genre_id),
+                           'programs': [make_program(genre_id, i) for i in range(self.programs)],
+                           })
+        return {'data': {'genres': genres}}
+
+    def program(self, prog_id):
+        return {'data': {'title': 'Program {0}'.format(prog_id),
+                         'type': 'show',
+                         'shortcat': prog_id,
+                         'r': make_rating(0),
+                         'annotation': 'Annotation of {0}'.format(prog_id),
+                         'preview': 'http://www.ntv.ru/images/{0}.jpg'.format(prog_id),
+                         'menus': [{'type': 'about', 'data': {'txt': 'About {0}'.format(prog_id)}},
+                                   {'type': 'archive', 'data': {'title': 'Archive', 'id': 1}},
+                                   ],
+                         }}
+
+    def archive(self, prog_id, archive_id, offset, limit):
+        if self.newest_first:
+            indexes = range(self.issues - offset, max(self.issues - offset - limit, -1), -1)
+        else:
+            indexes = range(offset - 1, min(offset - 1 + limit, self.issues))
+
+        result = self.program(prog_id)
+        result['data']['archive'] = {'issue_count': self.issues,
+                                     'issues': [make_issue(prog_id, i) for i in indexes],
+                                     }
+        return result
+
+    def video(self, video_id):
+        issue = make_issue('prog', int(video_id) - 1)
+        info = make_video(int(video_id), issue['ts'])
+        info['linked_entities'] = {'linked_issues': [issue]}
+        return {'info': info}
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """NTV API stub with configurable latency per request"""
+
+    daemon_threads = True
+    # Bursts of concurrent connections overflow the default backlog of 5
+    request_queue_size = 64
+
+    def __init__(self, data=None, latency=0.0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.data = data or StubData()
+        self.latency = latency
+        self.requests = []
+        self._bodies = {}
+        self._thread = None
+
+    @property
+    def api_url(self):
+        return 'http://127.0.0.1:{0}{1}'.format(self.server_port, API_PATH)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def reset(self):
+        """Forget the rendered bodies after the data was changed"""
+        self._bodies.clear()
+
+    def handle_error(self, request, client_address):
+        # Clients may close a streamed response before reading it all
+        if not issubclass(sys.exc_info()[0], (IOError, OSError)):
+            HTTPServer.handle_error(self, request, client_address)
+
+    def render(self, path, query, compress=False):
+        key = (path, query, compress)
+        if key not in self._bodies:
+            result = self.route(path, parse_qs(query))
+            if result is None:
+                body = None
+            elif compress:
+                body = gzip_bytes(self.render(path, query))
+            else:
+                body = json.dumps(result).encode('utf-8')
+            self._bodies[key] = body
+        return self._bodies[key]
+
+    def route(self, path, query):
+        parts = path[len(API_PATH):].strip('/').split('/')
+
+        if parts == ['pr']:
+            return self.data.main()
+        if len(parts) == 2 and parts[0] == 'prog':
+            return self.data.program(parts[1])
+        if len(parts) == 4 and parts[0] == 'prog' and parts[2] == 'archive':
+            offset = int(query.get('offset', ['1'])[0])
+            limit = int(query.get('limit', ['100'])[0])
+            return self.data.archive(parts[1], parts[3], offset, limit)
+        if len(parts) == 2 and parts[0] == 'v':
+            return self.data.video(parts[1])
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate sends on keep-alive connections,
+    # Nagle's algorithm would hold the body back until the delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.server.requests.append(url.path)
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        compress = 'gzip' in self.headers.get('Accept-Encoding', '')
+        body = self.server.render(url.path, url.query, compress)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        etag = '"{0}"'.format(hashlib.sha1(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if compress:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""Offline benchmark suite for the NTV client and the plugin routes
+
+Every NTV method and every plugin route is run against the local API
+stub (see benchmarks/stub.py). Reports latency percentiles, upstream
+request counts and peak Python memory per operation. The stub runs in
+the same process and keeps its rendered payloads, so only the first run
+of an operation includes the stub's own allocations.
+
+Usage: python -m benchmarks.suite [--latency 0.02] [--issues 2000] [--repeat 10]
+
+Route benchmarks need the Kodi stubs and script.module.simplemedia set up
+the same way as for tests.py, otherwise they are skipped.
+"""
+
+from __future__ import print_function, unicode_literals
+import os
+import gc
+import time
+import shutil
+import runpy
+import argparse
+import tempfile
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from benchmarks.stub import StubData, StubServer, addon_dir
+
+import resources.lib.ntv as ntv
+
+cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+class Result(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.timings = []
+        self.requests = []
+        self.peak_memory = 0
+
+    @staticmethod
+    def header():
+        return '{0:<48} {1:>9} {2:>9} {3:>9} {4:>6} {5:>10}'.format('operation', 'p50 ms', 'p90 ms', 'max ms',
+                                                                      'reqs', 'peak KiB')
+
+    def __str__(self):
+        return '{0:<48} {1:>9.1f} {2:>9.1f} {3:>9.1f} {4:>6.1f} {5:>10.0f}'.format(
+            self.name,
+            percentile(self.timings, 50) * 1000,
+            percentile(self.timings, 90) * 1000,
+            max(self.timings) * 1000,
+            float(sum(self.requests)) / len(self.requests),
+            self.peak_memory / 1024.0)
+
+
+def measure(name, server, func, repeat, setup=None):
+    result = Result(name)
+
+    for i in range(repeat):
+        context = setup() if setup is not None else None
+
+        gc.collect()
+        del server.requests[:]
+        if tracemalloc is not None:
+            tracemalloc.start()
+
+        start = time.time()
+        func(context)
+        result.timings.append(time.time() - start)
+
+        if tracemalloc is not None:
+            result.peak_memory = max(result.peak_memory, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        result.requests.append(len(server.requests))
+
+    return result
+
+
+def api_benchmarks(server, repeat):
+    cache_dirs = {}
+
+    def make_setup(cached, stream_json):
+
+        def setup():
+            params = {'api_url': server.api_url,
+                      'stream_json': stream_json,
+                      }
+            if cached:
+                params['cache_dir'] = cache_dirs.setdefault(stream_json, tempfile.mkdtemp())
+            return ntv.NTV(params)
+
+        return setup
+
+    operations = [('get_genres', lambda api: list(api.get_genres())),
+                  ('browse_programs', lambda api: list(api.browse_programs(1, {'limit': 20})['list'])),
+                  ('browse_programs (page 3)', lambda api: list(api.browse_programs(1, {'cursor': '20.2'})['list'])),
+                  ('browse_seasons', lambda api: list(api.browse_seasons('prog_1_1')['list'])),
+                  ('browse_episodes', lambda api: list(api.browse_episodes('prog_1_1', 1)['list'])),
+                  ('browse_episodes (stream)',
+                   lambda api: list(api.browse_episodes('prog_1_1', 1, {'stream': True})['list'])),
+                  ('get_video_info', lambda api: api.get_video_info(5)),
+                  ]
+
+    # stream_json decodes archive pages incrementally while they are received
+    setups = [('cold', make_setup(False, False)),
+              ('cold, stream_json', make_setup(False, True)),
+              ('cached', make_setup(True, False)),
+              ('cached, stream_json', make_setup(True, True)),
+              ]
+
+    results = []
+    for label, setup in setups:
+        for name, func in operations:
+            results.append(measure('{0} [{1}]'.format(name, label), server, func, repeat, setup))
+
+    for cache_dir in cache_dirs.values():
+        shutil.rmtree(cache_dir, True)
+    return results
+
+
+def route_benchmarks(server, repeat):
+    try:
+        import mock
+        import xbmcaddon
+        import simplemedia
+    except ImportError:
+        print('Route benchmarks skipped: Kodi stubs or simplemedia are not installed')
+        return []
+
+    addon_name = 'plugin.video.ntv.ru'
+    sm_name = 'script.module.simplemedia'
+
+    temp_dir = tempfile.mkdtemp()
+    xbmcaddon.init_addon(os.path.join(cwd, sm_name), os.path.join(temp_dir, sm_name))
+    xbmcaddon.init_addon(addon_dir, os.path.join(temp_dir, addon_name), True)
+
+    default_script = os.path.join(addon_dir, 'default.py')
+
+    class StubNTV(ntv.NTV):
+
+        def __init__(self, params=None):
+            params = dict(params or {})
+            params['api_url'] = server.api_url
+            super(StubNTV, self).__init__(params)
+
+    routes = [('root', '/'),
+              ('genre', '/genre/Genre 1'),
+              ('program_seasons', '/seasons/prog_1_1'),
+              ('program_episodes', '/episodes/prog_1_1/1'),
+              ('play_video', '/video/5'),
+              ]
+
+    results = []
+    for name, path in routes:
+        argv = ['plugin://{0}{1}'.format(addon_name, path), '1', '']
+
+        def run_route(context):
+            with mock.patch('simpleplugin.sys.argv', argv), \
+              mock.patch.object(ntv, 'NTV', StubNTV):
+                runpy.run_path(default_script, run_name='__main__')
+
+        results.append(measure('route {0}'.format(name), server, run_route, repeat))
+
+    shutil.rmtree(temp_dir, True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NTV offline benchmarks')
+    parser.add_argument('--latency', type=float, default=0.02, help='stub response latency, seconds')
+    parser.add_argument('--genres', type=int, default=10)
+    parser.add_argument('--programs', type=int, default=100, help='programs per genre')
+    parser.add_argument('--issues', type=int, default=2000, help='issues per archive')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    data = StubData(genres=args.genres, programs=args.programs, issues=args.issues)
+    server = StubServer(data, args.latency).start()
+
+    print('latency {0:.0f} ms, {1} genres x {2} programs, {3} issues per archive'.format(
+        args.latency * 1000, args.genres, args.programs, args.issues))
+    if tracemalloc is None:
+        print('tracemalloc is not available, peak memory is not reported')
+    print(Result.header())
+
+    try:
+        for benchmarks in (api_benchmarks, route_benchmarks):
+            for result in benchmarks(server, args.repeat):
+                print(result)
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
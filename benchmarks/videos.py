@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Wall time of resolving many video infos: sequential loop vs. NTV.get_video_infos
+
+Every tenth id is repeated to show that duplicates are requested once.
+
+Usage: python -m benchmarks.videos [latency_seconds]
+"""
+
+from __future__ import print_function, unicode_literals
+import sys
+import time
+import shutil
+import tempfile
+
+from benchmarks.stub import StubData, StubServer
+
+import resources.lib.ntv as ntv
+
+
+def run(latency=0.05, id_counts=(10, 30, 100), workers=(4, 8)):
+    server = StubServer(StubData(), latency).start()
+
+    print('latency: {0:.0f} ms'.format(latency * 1000))
+    columns = ['sequential'] + ['workers={0}'.format(w) for w in workers] + ['cached']
+    print('{0:>6} {1}'.format('ids', ' '.join('{0:>16}'.format(c) for c in columns)))
+
+    try:
+        for count in id_counts:
+            video_ids = list(range(1, count + 1))
+            video_ids.extend(video_ids[::10])
+
+            cells = []
+
+            api = ntv.NTV({'api_url': server.api_url})
+            del server.requests[:]
+            start = time.time()
+            expected = [api.get_video_info(video_id) for video_id in video_ids]
+            cells.append((time.time() - start, len(server.requests)))
+
+            for worker_count in workers:
+                api = ntv.NTV({'api_url': server.api_url,
+                               'workers': worker_count,
+                               })
+                del server.requests[:]
+                start = time.time()
+                infos = api.get_video_infos(video_ids)
+                cells.append((time.time() - start, len(server.requests)))
+                assert [info['video'] for info in infos] == [info['video'] for info in expected]
+
+            cache_dir = tempfile.mkdtemp()
+            api = ntv.NTV({'api_url': server.api_url,
+                           'cache_dir': cache_dir,
+                           })
+            api.get_video_infos(video_ids)
+            del server.requests[:]
+            start = time.time()
+            api.get_video_infos(video_ids)
+            cells.append((time.time() - start, len(server.requests)))
+            shutil.rmtree(cache_dir, True)
+
+            print('{0:>6} {1}'.format(len(video_ids), ' '.join('{0:>7.3f} s {1:>3} rq'.format(*c) for c in cells)))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    run(float(sys.argv[1]) if len(sys.argv) > 1 else 0.05)
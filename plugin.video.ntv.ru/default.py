@@ -3,6 +3,9 @@
 # License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
 
 from __future__ import unicode_literals
+import os
+import io
+import sys
 import time
 
 import xbmc
@@ -10,6 +13,8 @@
 import xbmcplugin
 
 import resources.lib.ntv as ntv
+from resources.lib.cache import FileCache
+from resources.lib import snapshot
 import simplemedia
 
 # Create plugin instance
@@ -18,10 +23,15 @@
 
 use_subtitles = plugin.get_setting('use_subtitles')
 
+_listings = None
+
 
 def _init_api():
 
-    settings = {'cache_dir': plugin.profile_dir}
+    settings = {'cache_dir': plugin.profile_dir,
+                'cache_artwork': plugin.get_setting('cache_artwork'),
+                'max_stale': plugin.get_setting('max_stale') * 3600,
+                }
 
     return ntv.NTV(settings)
 
@@ -74,84 +84,119 @@ def _list_root():
                      }
         yield list_item
 
-#     url = plugin.url_for('search')
-#     list_item = {'label': _('Search'),
-#                  'url': url,
-#                  'icon': plugin.icon,
-#                  'fanart': plugin.fanart,
-#                  'content_lookup': False,
-#                  }
-#    yield list_item
+    url = plugin.url_for('search')
+    list_item = {'label': _('Search'),
+                 'url': url,
+                 'icon': plugin.icon,
+                 'fanart': plugin.fanart,
+                 'content_lookup': False,
+                 }
+    yield list_item
 
 
 @plugin.route('/genre/<genre_title>')
 def genre(genre_title):
     params = {'offset': plugin.params.offset or 0,
               'limit': plugin.params.limit or plugin.get_setting('limit'),
+              'cursor': plugin.params.cursor,
               }
-    update_listing = (params['offset'] > 0)
+    update_listing = (params['cursor'] is not None or int(params['offset']) > 0)
     genre_id = _get_genre_id(genre_title)
-    
+    _remember_genre(genre_title)
+
     programs_info = _api.browse_programs(genre_id, params)
+    listing = _get_listing(programs_info['digest'], lambda: {'items': list(_list_programs(programs_info, genre_title))},
+                           'genre', genre_title)
+
+    plugin.create_directory(_with_artwork(listing['items']), content='movies', category=programs_info['title'], update_listing=update_listing)
 
-    plugin.create_directory(_list_programs(programs_info, genre_title), content='movies', category=programs_info['title'], update_listing=update_listing)
+    # Images are downloaded once the listing is shown, until then Kodi loads them by url
+    _api.prefetch_artwork(_get_thumbs(listing['items']))
+    _prefetch_next_programs(genre_id, programs_info)
+
+
+def _prefetch_next_programs(genre_id, data):
+    if data['next_cursor'] is not None:
+        params = {'cursor': data['next_cursor']}
+    elif (data['offset'] + data['limit']) < data['total']:
+        params = {'limit': data['limit'],
+                  'offset': data['offset'] + data['limit']}
+    else:
+        return
+
+    next_info = _api.browse_programs(genre_id, params)
+    _api.prefetch_artwork(program['img'] for program in next_info['list'])
 
 
 def _list_programs(data, genre_title):
 
-    mediatype = 'tvshow'
     for program in data['list']:
-        url = plugin.url_for('program_seasons', prog_id=program['shortcat'])
-
-        list_item = {'label': program['title'],
-                     'info': {'video': {  # 'date': date,
-                                        # 'country': country,
-                                        # 'year': year,
-                                        'title': program['title'],
-                                        'originaltitle': program['title'],
-                                        'sorttitle': program['title'],
-                                        'plotoutline': program['annotation'],
-                                        'plot': program['annotation'],
-                                        'mpaa': program['rating']['mpaa'],
-                                        # 'director': body.get('director', []),
-                                        # 'writer': body.get('writer', []),
-                                        # 'credits': body.get('credits', []),
-                                        'mediatype': mediatype,
-                                        }
-                              },
-                     'art': {'poster': program['img'],
-                             },
-                     'fanart': plugin.fanart,
-                     'thumb':  program['img'],
-                     'content_lookup': False,
-                     'is_folder': True,
-                     'url': url,
-                     }
+        list_item = _get_program_item(program)
         yield list_item
 
     if data['offset'] > 0:
-        params = {'limit': data['limit']}
-        prev_offset = data['offset'] - data['limit']
-        if prev_offset > 0:
-            params['offset'] = prev_offset
+        if data['prev_cursor'] is not None:
+            params = {'cursor': data['prev_cursor']}
+        else:
+            params = {'limit': data['limit']}
+            prev_offset = data['offset'] - data['limit']
+            if prev_offset > 0:
+                params['offset'] = prev_offset
         url = plugin.url_for('genre', genre_title=genre_title, **params)
         item_info = {'label': _('Previous page...'),
                      'url':   url}
         yield item_info
 
     if (data['offset'] + data['limit']) < data['total']:
-        params = {'limit': data['limit'],
-                  'offset': data['offset'] + data['limit']}
+        if data['next_cursor'] is not None:
+            params = {'cursor': data['next_cursor']}
+        else:
+            params = {'limit': data['limit'],
+                      'offset': data['offset'] + data['limit']}
         url = plugin.url_for('genre', genre_title=genre_title, **params)
         item_info = {'label': _('Next page...'),
                      'url':   url}
         yield item_info
 
 
+def _get_program_item(program):
+    mediatype = 'tvshow'
+    url = plugin.url_for('program_seasons', prog_id=program['shortcat'])
+    img = program['img']
+
+    list_item = {'label': program['title'],
+                 'info': {'video': {  # 'date': date,
+                                    # 'country': country,
+                                    # 'year': year,
+                                    'title': program['title'],
+                                    'originaltitle': program['title'],
+                                    'sorttitle': program['title'],
+                                    'plotoutline': program['annotation'],
+                                    'plot': program['annotation'],
+                                    'mpaa': program['rating']['mpaa'],
+                                    # 'director': body.get('director', []),
+                                    # 'writer': body.get('writer', []),
+                                    # 'credits': body.get('credits', []),
+                                    'mediatype': mediatype,
+                                    }
+                          },
+                 'art': {'poster': img,
+                         },
+                 'fanart': plugin.fanart,
+                 'thumb':  img,
+                 'content_lookup': False,
+                 'is_folder': True,
+                 'url': url,
+                 }
+    return list_item
+
+
 @plugin.route('/seasons/<prog_id>')
 def program_seasons(prog_id):
 
     seasons_info = _api.browse_seasons(prog_id)
+    listing = _get_listing(seasons_info['digest'], lambda: {'items': list(_list_seasons(seasons_info))},
+                           'seasons', prog_id)
 
 #    if seasons_info['count'] == 1:
 #        for season in seasons_info['list']:
@@ -160,11 +205,14 @@ def program_seasons(prog_id):
 #            xbmc.executebuiltin('Container.Update("%s")' % url)
 #            return
             
-    plugin.create_directory(_list_seasons(seasons_info), content='seasons', category=seasons_info['title'])
+    plugin.create_directory(_with_artwork(listing['items']), content='seasons', category=seasons_info['title'])
+
+    _api.prefetch_artwork([seasons_info['img']])
 
 
 def _list_seasons(data):
     mediatype = 'season'
+    img = data['img']
     for season in data['list']:
         url = plugin.url_for('program_episodes', prog_id=data['shortcat'], archive_id=season['id'])
 
@@ -184,10 +232,10 @@ def _list_seasons(data):
                                         'mediatype': mediatype,
                                         }
                               },
-                     'art': {'poster': data['img'],
+                     'art': {'poster': img,
                              },
                      'fanart': plugin.fanart,
-                     'thumb':  data['img'],
+                     'thumb':  img,
                      'content_lookup': False,
                      'is_folder': True,
                      'url': url,
@@ -206,26 +254,58 @@ def _get_genres():
     
 @plugin.mem_cached(180)
 def _get_genre_id(genre_title):
-    for genre in _get_genres():
-        if genre['title'] == genre_title:
-            return genre['id']
+    return _api.get_genre_id(genre_title)
+
+
+def _remember_genre(genre_title):
+    # Visited genres and archives are refreshed by the background service
+    with plugin.get_storage('recent.pcl') as storage:
+        genres = storage.get('genres', {})
+        genres[genre_title] = genres.get(genre_title, 0) + 1
+        storage['genres'] = genres
+
+
+def _remember_archive(prog_id, archive_id):
+    with plugin.get_storage('recent.pcl') as storage:
+        archives = [item for item in storage.get('archives', []) if item != [prog_id, archive_id]]
+        archives.insert(0, [prog_id, archive_id])
+        storage['archives'] = archives[:10]
 
 
 @plugin.route('/episodes/<prog_id>/<archive_id>')
 def program_episodes(prog_id, archive_id):
 
-    episodes_info = _api.browse_episodes(prog_id, archive_id)
+    episodes_info = _api.browse_episodes(prog_id, archive_id, {'stream': True})
+    _remember_archive(prog_id, archive_id)
 
-    plugin.create_directory(_list_episodes(episodes_info), content='episodes', category=episodes_info['title'],
+    listing = _get_listing(episodes_info['digest'], lambda: _list_episodes(episodes_info),
+                           'episodes', prog_id, archive_id)
+    plugin.create_directory(_with_artwork(listing['items']), content='episodes', category=episodes_info['title'],
                      total_items=episodes_info['count'], sort_methods=_get_sort_methods('episodes', 'date'))
 
+    # Episodes are listed from old to new, the newest ones are played most often
+    prefetch_count = plugin.get_setting('prefetch_count')
+    if prefetch_count > 0:
+        _api.prefetch_video_info(listing['video_ids'][-prefetch_count:])
+        _api.prefetch_artwork(reversed(listing['thumbs'][-prefetch_count:]))
+
 
 def _list_episodes(data):
-    mediatype = 'episode'
-    for episode in data['list']:
-        
-        list_item = _get_item(data, episode)
-        yield list_item
+    # Ids and images are collected as the items are listed, so a listing
+    # that is not cached goes to the directory as episodes are read
+    video_ids = []
+    thumbs = []
+
+    def items():
+        for episode in data['list']:
+            video_ids.append(episode['id'])
+            thumbs.append(episode['img'])
+            yield _get_item(data, episode)
+
+    return {'items': items(),
+            'video_ids': video_ids,
+            'thumbs': thumbs,
+            }
 
 
 def _get_item(data, episode):
@@ -233,6 +313,7 @@ def _get_item(data, episode):
     url = plugin.url_for('play_video', video_id=episode['id'])
 
     st_time = time.gmtime(episode['timestamp'])     
+    img = episode['img']
     list_item = {'label': episode['title'],
                  'info': {'video': {'date': time.strftime('%d.%m.%Y', st_time),
                                     # 'country': country,
@@ -256,10 +337,10 @@ def _get_item(data, episode):
                                     'mediatype': mediatype,
                                     }
                           },
-                 'art': {'poster': episode['img'],
+                 'art': {'poster': img,
                          },
                  'fanart': plugin.fanart,
-                 'thumb':  episode['img'],
+                 'thumb':  img,
                  'content_lookup': False,
                  'is_folder': False,
                  'is_playable': True,
@@ -271,16 +352,41 @@ def _get_item(data, episode):
       and episode['subtitles'] is not None:
         list_item['subtitles'] = [episode['subtitles']]
 
+    if episode['parts'] is not None:
+        parts_url = plugin.url_for('play_parts', video_ids=','.join('{0}'.format(video_id) for video_id in episode['parts']))
+        list_item['context_menu'] = [(_('Play all parts'), 'RunPlugin({0})'.format(parts_url))]
+
     return list_item
 
     
 @plugin.route('/video/<video_id>')
 def play_video(video_id):
     video_info = _api.get_video_info(video_id)
-    list_item = _get_item(video_info, video_info['item']) 
+    list_item = _local_artwork(_get_item(video_info, video_info['item']))
     list_item['path'] = _get_video_path(video_info)
     plugin.resolve_url(list_item)
 
+
+@plugin.route('/parts/<video_ids>')
+def play_parts(video_ids):
+    # Stream urls of all parts are resolved up front, so playback
+    # goes on from part to part without further requests
+    video_infos = _api.get_video_infos(video_ids.split(','), skip_errors=True)
+
+    playlist = xbmc.PlayList(xbmc.PLAYLIST_VIDEO)
+    playlist.clear()
+    for video_info in video_infos:
+        if video_info is None:
+            continue
+        list_item = _local_artwork(_get_item(video_info, video_info['item']))
+        list_item['path'] = _get_video_path(video_info)
+        playlist.add(list_item['path'], plugin.create_list_item(list_item))
+
+    if playlist.size():
+        xbmc.Player().play(playlist)
+    else:
+        _show_notification(_('Video not found'))
+
     
 @plugin.route('/live')
 def play_live():
@@ -290,7 +396,85 @@ def play_live():
     
 @plugin.route('/search')
 def search():
-    pass
+    keyword = plugin.params.keyword or ''
+    if not keyword:
+        kbd = xbmc.Keyboard('', _('Search'))
+        kbd.doModal()
+        if kbd.isConfirmed():
+            keyword = kbd.getText()
+    if isinstance(keyword, bytes):
+        keyword = keyword.decode('utf-8')
+
+    if not keyword:
+        plugin.create_directory([], succeeded=False)
+        return
+
+    search_info = _api.search(keyword)
+    if not search_info['count']:
+        _show_notification(_('Nothing found!'))
+
+    plugin.create_directory(_with_artwork(_list_search(search_info)), content='videos', category=keyword,
+                            sort_methods=_get_sort_methods('search'))
+
+
+def _list_search(data):
+    for program in data['programs']:
+        yield _get_program_item(program)
+
+    for episode in data['episodes']:
+        yield _get_item({}, episode)
+
+
+def _get_listing(digest, build, *key_parts):
+    """Rendered items of a directory
+
+    Without a digest the listing is returned as built, its items may be
+    an iterator then. Listings are kept by the digest of the API data they are built from
+    along with everything else that goes into the items, so a directory
+    that did not change is shown without building its items again.
+    Images are left as urls here, see _with_artwork().
+    """
+    global _listings
+
+    if digest is None:
+        return build()
+
+    if _listings is None:
+        _listings = FileCache(os.path.join(plugin.profile_dir, 'listings'), 10 * 1024 * 1024)
+
+    key = FileCache.make_key('listing', digest, use_subtitles, plugin.get_setting('video_quality'),
+                             plugin.addon.getAddonInfo('version'), xbmc.getLanguage(), *key_parts)
+    entry = _listings.get(key)
+    if entry is not None:
+        listing = snapshot.loads(entry[1])
+        if listing is not None:
+            return listing
+
+    # Snapshots of another version or interpreter are overwritten here
+    listing = build()
+    listing['items'] = list(listing['items'])
+    _listings.set(key, snapshot.dumps(listing))
+    return listing
+
+
+def _with_artwork(items):
+    for item in items:
+        yield _local_artwork(item)
+
+
+def _local_artwork(item):
+    """Copy of the item showing images from the artwork cache"""
+    if not item.get('thumb'):
+        return item
+
+    img = _api.get_artwork(item['thumb'])
+    item = dict(item, thumb=img)
+    item['art'] = dict(item['art'], poster=img)
+    return item
+
+
+def _get_thumbs(items):
+    return [item['thumb'] for item in items if item.get('thumb')]
 
 
 def _get_video_path(data):
@@ -331,6 +515,36 @@ def _get_image(image):
     return image if xbmc.skinHasImage(image) else plugin.icon
 
 
+def _run():
+    profile = plugin.get_setting('profile')
+
+    start = time.time()
+    try:
+        plugin.run()
+        # The listing is shown already, refresh what it was built from outdated data
+        _api.revalidate_stale()
+    finally:
+        if profile:
+            _dump_profile(profile, time.time() - start)
+
+
+def _dump_profile(target, elapsed):
+    route = sys.argv[0] + sys.argv[2]
+    if isinstance(route, bytes):
+        route = route.decode('utf-8')
+
+    lines = ['{0}: {1:.3f} s'.format(route, elapsed)]
+    lines.extend('  {0}'.format(line) for line in _api.profiler.format_stats())
+
+    if target == 1:
+        for line in lines:
+            plugin.log_notice(line)
+    else:
+        profile_path = os.path.join(plugin.profile_dir, 'profile.log')
+        with io.open(profile_path, 'a', encoding='utf-8') as f:
+            f.write('{0} {1}\n'.format(time.strftime('%Y-%m-%d %H:%M:%S'), '\n'.join(lines)))
+
+
 if __name__ == '__main__':
     _api = _init_api()
-    plugin.run()
+    _run()
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+# Module: asyncntv
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+#
+# Python 3 only, import it through ntv.NTV or after checking ntv.PY3
+
+import time
+import json
+import asyncio
+import concurrent.futures
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .ntv import NTV, NTVApiError, CachedResponse, requests
+
+available = aiohttp is not None
+
+
+class AsyncNTV(object):
+    """Asyncio counterpart of NTV for fan-out workloads
+
+    Methods are coroutines returning the same results as the NTV ones.
+    Requests share one connection pool and at most ``workers`` of them
+    are in flight at once. The cache, catalog, profiler and parsing of
+    the wrapped NTV instance are used, so both clients can be mixed.
+
+    HTTP goes through aiohttp when it is installed. Otherwise the
+    blocking requests session of the NTV instance is run in a thread
+    pool, which keeps the API usable but not cheaper than threads.
+
+    Episodes are always loaded as a whole, the local archive store and
+    JSON streaming of NTV are not used here.
+    """
+
+    def __init__(self, params=None, ntv=None):
+        self._ntv = ntv or NTV(params)
+        self._semaphore = None
+        self._client = None
+        self._executor = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    @property
+    def profiler(self):
+        return self._ntv.profiler
+
+    async def get_genres(self):
+        await self._load_catalog()
+        return list(self._ntv.get_genres())
+
+    async def browse_programs(self, genre_id, params=None):
+        await self._load_catalog()
+        return self._ntv.browse_programs(genre_id, params)
+
+    async def browse_seasons(self, prog_id):
+        json = await self._get_json('program', url_params={'prog_id': prog_id})
+        return self._ntv._seasons_result(json['data'])
+
+    async def browse_episodes(self, prog_id, archive_id, params=None):
+        url_params = {'prog_id': prog_id,
+                      'archive_id': archive_id}
+        limit = self._ntv._archive_limit
+
+        data = await self._get_archive_page(url_params, 1)
+        archive = data.get('archive')
+
+        issues = []
+        if archive is not None:
+            offsets = range(1 + limit, archive['issue_count'] + 1, limit)
+            pages = await asyncio.gather(*[self._get_archive_page(url_params, offset) for offset in offsets])
+
+            issues.extend(archive['issues'])
+            for page in pages:
+                if page.get('archive') is None:
+                    break
+                issues.extend(page['archive']['issues'])
+            issues.sort(key=NTV._sort_by_ts)
+
+        return self._ntv._episodes_result(data, issues, len(issues))
+
+    async def _get_archive_page(self, url_params, offset):
+        params = {'limit': self._ntv._archive_limit,
+                  'offset': offset,
+                  }
+        json = await self._get_json('archive', params, url_params)
+        return json['data']
+
+    async def get_video_info(self, video_id):
+        json = await self._get_json('video', url_params={'video_id': video_id})
+        return NTV._video_info_result(json['info'])
+
+    async def get_video_infos(self, video_ids, skip_errors=False):
+        """See NTV.get_video_infos"""
+        video_ids = ['{0}'.format(video_id) for video_id in video_ids]
+
+        tasks = {}
+        for video_id in video_ids:
+            if video_id not in tasks:
+                tasks[video_id] = self._get_video_info_or_none(video_id) if skip_errors \
+                                  else self.get_video_info(video_id)
+
+        unique_ids = list(tasks)
+        results = await asyncio.gather(*[tasks[video_id] for video_id in unique_ids])
+        infos = dict(zip(unique_ids, results))
+
+        return [infos[video_id] for video_id in video_ids]
+
+    async def _get_video_info_or_none(self, video_id):
+        try:
+            return await self.get_video_info(video_id)
+        except (NTVApiError, KeyError, IndexError):
+            return None
+
+    async def _load_catalog(self):
+        if self._ntv._catalog is None:
+            json, cache = await self._get_json('main', with_cache_state=True)
+            self._ntv._set_catalog(json['data'], cache in ('hit', 'stale', 'revalidated'))
+
+    async def _get_json(self, action, params=None, url_params=None, with_cache_state=False):
+        ntv = self._ntv
+        params = params or {}
+
+        start = time.time()
+        try:
+            content, cache, info = await self._request(action, params, url_params)
+        except NTVApiError:
+            ntv.profiler.record(action, 'fetch', time.time() - start, error=True)
+            raise
+        ntv.profiler.record(action, 'fetch', time.time() - start, cache=cache, **info)
+
+        start = time.time()
+        try:
+            result = json.loads(content.decode('utf-8'))
+        except ValueError as err:
+            raise NTVApiError(err)
+        finally:
+            ntv.profiler.record(action, 'decode', time.time() - start)
+
+        if with_cache_state:
+            return result, cache
+        return result
+
+    async def _request(self, action, params, url_params):
+        ntv = self._ntv
+        url, cache_key, entry, headers = ntv._prepare_request(action, params, url_params)
+
+        if headers is None:
+            cache = 'stale' if cache_key in ntv._stale else 'hit'
+            return entry[1], cache, {'status': CachedResponse.status_code}
+
+        if cache_key is None:
+            status, response_url, response_headers, content, info = await self._fetch_info(url, params, headers)
+            return content, 'off', info
+
+        # Same single flight as NTV._request, polling keeps the loop running
+        lock = ntv._get_lock(cache_key)
+        if not lock.acquire():
+            wait_start = time.time()
+            while not lock.is_free() \
+              and time.time() < wait_start + ntv._lock_timeout:
+                await asyncio.sleep(0.05)
+
+            shared = ntv._cache.get(cache_key)
+            if shared is not None \
+              and shared[0]['stored'] >= wait_start:
+                return shared[1], 'shared', {'status': CachedResponse.status_code}
+
+            # No luck in the other process, fetch it here
+            url, cache_key, entry, headers = ntv._prepare_request(action, params, url_params, True)
+            lock.acquire()
+
+        try:
+            status, response_url, response_headers, content, info = await self._fetch_info(url, params, headers)
+
+            if status == 304 \
+              and entry is not None:
+                ntv._cache.update_meta(cache_key, stored=time.time())
+                return entry[1], 'revalidated', info
+
+            ntv._cache.set(cache_key, content, ntv._response_meta(response_url, response_headers))
+        finally:
+            lock.release()
+
+        return content, 'miss', info
+
+    async def _fetch_info(self, url, params, headers):
+        """Return ``(status, url, headers, content, info)``, the info is
+        recorded by the profiler"""
+        status, response_url, response_headers, content, wire_bytes = await self._fetch(url, params, headers)
+        info = {'status': status,
+                'bytes': len(content),
+                'wire_bytes': wire_bytes,
+                }
+        return status, response_url, response_headers, content, info
+
+    async def _fetch(self, url, params, headers):
+        """Return ``(status, url, headers, content, wire_bytes)``"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._ntv._workers)
+
+        async with self._semaphore:
+            if aiohttp is None:
+                return await self._fetch_in_executor(url, params, headers)
+
+            # Same policy as the urllib3 Retry of the requests session
+            retries = self._ntv._retries
+            for attempt in range(retries + 1):
+                if attempt:
+                    await asyncio.sleep(self._ntv._backoff_factor * (2 ** (attempt - 1)))
+                try:
+                    result = await self._fetch_aiohttp(url, params, headers)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if attempt == retries:
+                        raise NTVApiError('Connection error')
+                    continue
+                if result[0] not in (500, 502, 503, 504) \
+                  or attempt == retries:
+                    break
+
+        if result[0] >= 400:
+            raise NTVApiError('HTTP error {0}'.format(result[0]))
+        return result
+
+    async def _fetch_aiohttp(self, url, params, headers):
+        if self._client is None:
+            connect_timeout, read_timeout = self._ntv._timeout
+            self._client = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._ntv._pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout))
+
+        async with self._client.get(url, params=params, headers=headers) as r:
+            content = await r.read()
+            wire_bytes = int(r.headers.get('Content-Length') or len(content))
+            return r.status, str(r.url), r.headers, content, wire_bytes
+
+    async def _fetch_in_executor(self, url, params, headers):
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(self._ntv._workers)
+
+        loop = asyncio.get_event_loop()
+        try:
+            r = await loop.run_in_executor(self._executor, self._ntv._get, url, params, headers)
+        except requests.RequestException as err:
+            raise NTVApiError(err)
+
+        return r.status_code, r.url, r.headers, r.content, NTV._wire_bytes(r)
+
+
+def run(ntv, method, *args):
+    """Run a coroutine method of AsyncNTV over the NTV instance from
+    blocking code, in its own event loop"""
+
+    async def main():
+        async with AsyncNTV(ntv=ntv) as api:
+            return await getattr(api, method)(*args)
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(main())
+    finally:
+        loop.close()
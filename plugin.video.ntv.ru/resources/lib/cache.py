@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# Module: cache
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import os
+import json
+import time
+import hashlib
+
+
+class FileCache(object):
+    """Size bounded on-disk key/value store with LRU eviction
+
+    Every entry is kept in its own file: a JSON header line with entry
+    metadata followed by the raw body bytes. The file modification time
+    is used as the last access time, so the least recently used entries
+    are removed first when the cache outgrows ``max_size`` bytes.
+
+    The directory is scanned on the first write of the process. Later
+    writes only add to the size estimate, so the scan is repeated when
+    the estimate crosses ``max_size`` or every ``_scan_interval``
+    writes, as other processes write to the same directory.
+    """
+
+    _suffix = '.cache'
+    _scan_interval = 100
+
+    def __init__(self, path, max_size=20 * 1024 * 1024):
+        self._path = path
+        self._max_size = max_size
+        self._size = None
+        self._writes = 0
+
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+
+    @staticmethod
+    def make_key(*parts):
+        key_parts = []
+        for part in parts:
+            if isinstance(part, dict):
+                part = '&'.join('{0}={1}'.format(key, val) for key, val in sorted(part.items()))
+            key_parts.append('{0}'.format(part))
+
+        return hashlib.sha1('|'.join(key_parts).encode('utf-8')).hexdigest()
+
+    def _file_path(self, key):
+        return os.path.join(self._path, key + self._suffix)
+
+    def get(self, key):
+        """Return ``(meta, body)`` stored for the key or ``None``"""
+        file_path = self._file_path(key)
+
+        try:
+            with open(file_path, 'rb') as f:
+                meta = json.loads(f.readline().decode('utf-8'))
+                body = f.read()
+            os.utime(file_path, None)
+        except (IOError, OSError, ValueError):
+            return None
+
+        return meta, body
+
+    def set(self, key, body, meta=None):
+        meta = dict(meta or {})
+        meta.setdefault('stored', time.time())
+
+        file_path = self._file_path(key)
+        tmp_path = '{0}.{1}.tmp'.format(file_path, os.getpid())
+        header = json.dumps(meta).encode('utf-8') + b'\n'
+
+        try:
+            old_size = os.path.getsize(file_path)
+        except OSError:
+            old_size = 0
+
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(header)
+                f.write(body)
+            self._replace(tmp_path, file_path)
+        except (IOError, OSError):
+            self._remove(tmp_path)
+            return
+
+        self._added(len(header) + len(body) - old_size)
+
+    def _added(self, size):
+        self._writes += 1
+        if self._size is None \
+          or self._writes >= self._scan_interval:
+            self._evict()
+            return
+
+        self._size += size
+        if self._size > self._max_size:
+            self._evict()
+
+    def update_meta(self, key, **kwargs):
+        entry = self.get(key)
+        if entry is not None:
+            meta, body = entry
+            meta.update(kwargs)
+            self.set(key, body, meta)
+
+    def delete(self, key):
+        self._remove(self._file_path(key))
+
+    def _evict(self):
+        entries = []
+        total_size = 0
+        for file_name in os.listdir(self._path):
+            if not self._is_entry(file_name):
+                continue
+            file_path = os.path.join(self._path, file_name)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file_path))
+            total_size += stat.st_size
+
+        if total_size > self._max_size:
+            entries.sort()
+            for mtime, size, file_path in entries:
+                self._remove(file_path)
+                total_size -= size
+                if total_size <= self._max_size:
+                    break
+
+        self._size = total_size
+        self._writes = 0
+
+    def _is_entry(self, file_name):
+        return file_name.endswith(self._suffix)
+
+    @staticmethod
+    def _replace(src, dst):
+        try:
+            os.rename(src, dst)
+        except OSError:
+            # os.rename() does not overwrite existing files on Windows
+            FileCache._remove(dst)
+            os.rename(src, dst)
+
+    @staticmethod
+    def _remove(file_path):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+
+class ArtworkCache(FileCache):
+    """Size bounded directory of downloaded images with LRU eviction
+
+    Images are stored as plain files named after the url hash with the
+    url's extension kept, so Kodi can load them directly.
+    """
+
+    def _file_path(self, url):
+        ext = os.path.splitext(url.split('?')[0])[1]
+        if len(ext) > 5:
+            ext = ''
+        return os.path.join(self._path, self.make_key(url) + ext.lower())
+
+    def _is_entry(self, file_name):
+        return not file_name.endswith('.tmp')
+
+    def get_path(self, url, touch=True):
+        """Return the local path of the image or ``None``"""
+        file_path = self._file_path(url)
+
+        try:
+            if touch:
+                os.utime(file_path, None)
+            elif not os.path.exists(file_path):
+                return None
+        except OSError:
+            return None
+
+        return file_path
+
+    def add(self, url, body):
+        """Store the image, call evict() once done with a batch"""
+        file_path = self._file_path(url)
+        tmp_path = '{0}.{1}.tmp'.format(file_path, os.getpid())
+
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            self._replace(tmp_path, file_path)
+        except (IOError, OSError):
+            self._remove(tmp_path)
+
+    def evict(self):
+        self._evict()
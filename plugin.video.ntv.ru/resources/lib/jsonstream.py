@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# Module: jsonstream
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import re
+import json
+import codecs
+
+ANY = '*'
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+_string_end = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_special = re.compile(r'["{}\[\]]')
+_scalar_end = re.compile(r'[,}\]\s]')
+
+
+class JSONStreamError(ValueError):
+    pass
+
+
+def iterparse(chunks, paths):
+    """Decode only the parts of a JSON document located at ``paths``
+
+    ``chunks`` is an iterable of bytes (e.g. ``Response.iter_content()``),
+    ``paths`` is a list of tuples of object keys and array indexes, where
+    ``ANY`` matches every key or index. Yields ``(path, value)`` pairs in
+    document order; everything else is skipped without being decoded.
+    """
+    reader = _Reader(chunks)
+
+    for item in reader.walk((), [tuple(path) for path in paths]):
+        yield item
+
+
+class _Reader(object):
+
+    _compact_size = 65536
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _read_more(self):
+        if self._eof:
+            return False
+
+        if self._pos > self._compact_size:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+
+        for chunk in self._chunks:
+            if chunk:
+                self._buf += self._decoder.decode(chunk)
+                return True
+
+        self._buf += self._decoder.decode(b'', True)
+        self._eof = True
+        return True
+
+    def _peek(self):
+        while True:
+            self._pos = _whitespace.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._read_more():
+                return ''
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char not in chars \
+          or not char:
+            raise JSONStreamError('Expected {0!r} at position {1}'.format(chars, self._pos))
+        self._pos += 1
+        return char
+
+    def _decode_value(self):
+        if self._peek() not in '"{[':
+            # Numbers and literals may continue in the next chunk
+            while _scalar_end.search(self._buf, self._pos) is None \
+              and self._read_more():
+                pass
+
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buf, self._pos)
+            except ValueError:
+                if self._read_more():
+                    continue
+                raise JSONStreamError('Truncated document')
+
+            self._pos = end
+            return value
+
+    def _skip_value(self):
+        char = self._peek()
+        if char == '"':
+            self._pos += 1
+            self._skip_string()
+        elif char in '{[':
+            self._skip_container()
+        else:
+            while True:
+                match = _scalar_end.search(self._buf, self._pos)
+                if match is not None:
+                    self._pos = match.start()
+                    return
+                if not self._read_more():
+                    self._pos = len(self._buf)
+                    return
+
+    def _skip_string(self):
+        while True:
+            match = _string_end.match(self._buf, self._pos)
+            if match is not None:
+                self._pos = match.end()
+                return
+            if not self._read_more():
+                raise JSONStreamError('Truncated string')
+
+    def _skip_container(self):
+        depth = 0
+        while True:
+            match = _special.search(self._buf, self._pos)
+            if match is None:
+                self._pos = len(self._buf)
+                if not self._read_more():
+                    raise JSONStreamError('Truncated document')
+                continue
+
+            char = match.group()
+            self._pos = match.end()
+            if char == '"':
+                self._skip_string()
+            elif char in '{[':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def _read_key(self):
+        if self._peek() != '"':
+            raise JSONStreamError('Expected object key at position {0}'.format(self._pos))
+        key = self._decode_value()
+        self._expect(':')
+        return key
+
+    def walk(self, path, paths):
+        matches = [pattern for pattern in paths if _match(pattern, path)]
+
+        if not matches:
+            self._skip_value()
+            return
+
+        for pattern in matches:
+            if len(pattern) == len(path):
+                yield path, self._decode_value()
+                return
+
+        char = self._peek()
+        if char == '{':
+            self._pos += 1
+            if self._peek() == '}':
+                self._pos += 1
+                return
+            while True:
+                key = self._read_key()
+                for item in self.walk(path + (key,), matches):
+                    yield item
+                if self._expect(',}') == '}':
+                    return
+        elif char == '[':
+            self._pos += 1
+            if self._peek() == ']':
+                self._pos += 1
+                return
+            index = 0
+            while True:
+                for item in self.walk(path + (index,), matches):
+                    yield item
+                index += 1
+                if self._expect(',]') == ']':
+                    return
+        else:
+            self._skip_value()
+
+
+def _match(pattern, path):
+    if len(pattern) < len(path):
+        return False
+
+    for expected, actual in zip(pattern, path):
+        if expected != ANY \
+          and expected != actual:
+            return False
+
+    return True
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# Module: locks
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import os
+import time
+
+
+class FileLock(object):
+    """Non-blocking lock shared between processes
+
+    The lock is held by an exclusively created file, which works the
+    same on every platform Kodi runs on. A lock file older than
+    ``stale_after`` seconds is left by a process that died while holding
+    it and is removed.
+    """
+
+    def __init__(self, path, stale_after=60):
+        self._path = path
+        self._stale_after = stale_after
+        self._owned = False
+
+    def acquire(self):
+        """Take the lock if it is free, return whether it was taken"""
+        for attempt in range(2):
+            try:
+                fd = os.open(self._path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError:
+                if attempt \
+                  or not self._break_stale():
+                    return False
+                continue
+
+            os.close(fd)
+            self._owned = True
+            return True
+
+    def release(self):
+        if self._owned:
+            self._owned = False
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+
+    def wait(self, timeout, interval=0.05):
+        """Wait until the lock is free, return False on timeout"""
+        end = time.time() + timeout
+        while not self.is_free():
+            if time.time() >= end:
+                return False
+            time.sleep(interval)
+        return True
+
+    def is_free(self):
+        """Return whether the lock is not held, breaking a stale one"""
+        return not os.path.exists(self._path) \
+          or self._break_stale()
+
+    def _break_stale(self):
+        try:
+            if time.time() - os.path.getmtime(self._path) < self._stale_after:
+                return False
+            os.remove(self._path)
+        except OSError:
+            pass
+        return True
@@ -4,33 +4,179 @@
 
 from __future__ import unicode_literals
 
-import requests
+import os
+import sys
+import time
+import json
+import hashlib
+import importlib
 import urllib
 import re
 import random
+import heapq
+import itertools
 
-from future.utils import PY3, iteritems
+from .cache import FileCache, ArtworkCache
+from .locks import FileLock
+from . import workers
+from . import jsonstream
+from . import snapshot
+from .profiler import Profiler
+from .searchindex import SearchIndex
+from .records import Program, Season, Episode, Rating
+
+# future.utils takes about as long to import as the rest of the module
+# (it pulls in inspect), the two helpers used here are defined in place
+PY3 = sys.version_info[0] >= 3
 
 if PY3:
     basestring = str
 
 
+class _LazyModule(object):
+    """Module imported on the first attribute access
+
+    Importing ``requests`` takes most of the plugin startup time, while
+    routes served from the cache never touch the network.
+    """
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+
+requests = _LazyModule('requests')
+
+# Sessions shared by all NTV instances of the process (see 'keep_session')
+_sessions = {}
+
+
 class NTVApiError(Exception):
     """Custom exception"""
     pass
 
 
+class CachedResponse(object):
+    """Response restored from the on-disk cache"""
+
+    status_code = 200
+
+    def __init__(self, meta, content):
+        self.content = content
+        self.url = meta.get('url', '')
+
+    def json(self):
+        return json.loads(self.content.decode('utf-8'))
+
+    def iter_content(self, chunk_size=1):
+        for pos in range(0, len(self.content), chunk_size):
+            yield self.content[pos:(pos + chunk_size)]
+
+    def close(self):
+        pass
+
+
+class CachingResponse(object):
+    """Streamed response stored in the cache once it is read to the end"""
+
+    def __init__(self, response, cache, key, meta, lock=None):
+        self.status_code = response.status_code
+        self.raw = response.raw
+        self.headers = response.headers
+        self._response = response
+        self._cache = cache
+        self._key = key
+        self._meta = meta
+        self._lock = lock
+
+    def iter_content(self, chunk_size=1):
+        chunks = []
+        for chunk in self._response.iter_content(chunk_size):
+            chunks.append(chunk)
+            yield chunk
+
+        self._cache.set(self._key, b''.join(chunks), self._meta)
+
+    def close(self):
+        self._response.close()
+        if self._lock is not None:
+            self._lock.release()
+
+
+class Catalog(object):
+    """Main document of the API with genre and program indexes"""
+
+    def __init__(self, data):
+        self.genres = data['genres']
+
+        self._genre_ids = {}
+        self._programs = {}
+        for index, genre in enumerate(self.genres):
+            self._genre_ids.setdefault(genre['title'], index)
+            for program in genre['programs']:
+                self._programs.setdefault(program['shortcat'], program)
+                self._programs.setdefault('{0}'.format(program['id']), program)
+
+    def get_genre(self, genre_id):
+        return self.genres[genre_id]
+
+    def get_programs(self):
+        """All programs of the catalog, each one once"""
+        shortcats = set()
+        for genre in self.genres:
+            for program in genre['programs']:
+                if program['shortcat'] not in shortcats:
+                    shortcats.add(program['shortcat'])
+                    yield program
+
+    def get_genre_id(self, title):
+        return self._genre_ids.get(title)
+
+    def get_genre_ids(self):
+        return dict(self._genre_ids)
+
+    def get_program(self, prog_id):
+        return self._programs.get('{0}'.format(prog_id))
+
+
 class NTV(object):
 
+    _generation_key = FileCache.make_key('programs', 'generation')
+
+    # Parts of archive pages used by browse_episodes
+    _archive_paths = [('data', 'title'),
+                      ('data', 'type'),
+                      ('data', 'shortcat'),
+                      ('data', 'r'),
+                      ('data', 'annotation'),
+                      ('data', 'archive', 'issue_count'),
+                      ('data', 'archive', 'issues', jsonstream.ANY),
+                      ]
+
     def __init__(self, params=None):
         params = params or {}
 
-        api_url = 'http://www.ntv.ru/m/v10'
+        api_url = params.get('api_url', 'http://www.ntv.ru/m/v10')
 
-        self._actions = {'main': api_url + '/pr',
-                         'program': api_url + '/prog/#prog_id',
-                         'video': api_url + '/v/#video_id',
-                         'archive': api_url + '/prog/#prog_id/archive/#archive_id',
+        # 'stale': outdated entries may be served while revalidating (see 'max_stale')
+        self._actions = {'main': {'url': api_url + '/pr',
+                                  'cache_ttl': 1800,
+                                  'stale': True,
+                                  },
+                         'program': {'url': api_url + '/prog/#prog_id',
+                                     'cache_ttl': 1800,
+                                     'stale': True,
+                                     },
+                         'video': {'url': api_url + '/v/#video_id',
+                                   'cache_ttl': 600,
+                                   },
+                         'archive': {'url': api_url + '/prog/#prog_id/archive/#archive_id',
+                                     'cache_ttl': 900,
+                                     'stale': True,
+                                     },
                          }
 
         self._headers = {'User-Agent': 'ru.ntv.client_4.5.1',
@@ -38,37 +184,310 @@ def __init__(self, params=None):
                          'Connection': 'keep-alive',
                          }
 
-    def _http_request(self, action, params=None, url_params=None):
-        params = params or {}
+        self._timeout = (params.get('connect_timeout', 5),
+                         params.get('read_timeout', 15))
+        # Longest wait for a response being fetched by another process
+        self._lock_timeout = params.get('lock_timeout', sum(self._timeout))
+        self._retries = params.get('retries', 3)
+        self._backoff_factor = params.get('backoff_factor', 0.5)
+        self._pool_size = params.get('pool_size', 10)
+        self._workers = params.get('workers', 4)
+        self._archive_limit = 100
+        self._stream_json = params.get('stream_json', False)
+        self._refresh = params.get('refresh', False)
+        self._max_stale = params.get('max_stale', 0)
+        self._stale = {}
+        self._keep_session = params.get('keep_session', True)
+        self._async_batch = PY3 and params.get('async_batch', True)
+        self._session = None
+        self._catalog = None
+        self._program_pages = {}
 
+        self.profiler = Profiler()
+
+        cache_dir = params.get('cache_dir')
+        if cache_dir:
+            self._cache = FileCache(os.path.join(cache_dir, 'http'),
+                                    params.get('cache_size', 20 * 1024 * 1024))
+            self._archives = FileCache(os.path.join(cache_dir, 'archives'),
+                                       params.get('archives_size', 50 * 1024 * 1024))
+            self._search = SearchIndex(os.path.join(cache_dir, 'search.db'))
+            self._locks_dir = os.path.join(cache_dir, 'locks')
+            if not os.path.isdir(self._locks_dir):
+                try:
+                    os.makedirs(self._locks_dir)
+                except OSError:
+                    if not os.path.isdir(self._locks_dir):
+                        raise
+        else:
+            self._cache = None
+            self._archives = None
+            self._search = None
+            self._locks_dir = None
+
+        if cache_dir \
+          and params.get('cache_artwork', False):
+            self._artwork = ArtworkCache(os.path.join(cache_dir, 'artwork'),
+                                         params.get('artwork_size', 30 * 1024 * 1024))
+        else:
+            self._artwork = None
+
+    def _http_request(self, action, params=None, url_params=None, stream=False, revalidate=False):
+        start = time.time()
+        try:
+            r, cache = self._request(action, params or {}, url_params, stream, revalidate)
+        except NTVApiError:
+            self.profiler.record(action, 'fetch', time.time() - start, error=True)
+            raise
+
+        info = {'cache': cache,
+                'status': r.status_code,
+                }
+        if not stream:
+            info['bytes'] = len(r.content)
+            info['wire_bytes'] = self._wire_bytes(r)
+        self.profiler.record(action, 'fetch', time.time() - start, **info)
+
+        return r
+
+    def _request(self, action, params, url_params, stream, revalidate=False):
+
+        url, cache_key, entry, headers = self._prepare_request(action, params, url_params, revalidate)
+
+        if cache_key is None:
+            return self._get(url, params, headers, stream), 'off'
+
+        if headers is None:
+            return CachedResponse(*entry), 'stale' if cache_key in self._stale else 'hit'
+
+        # Single flight across plugin processes: while one of them fetches
+        # the url, the others wait for the response to get into the cache
+        lock = self._get_lock(cache_key)
+        if not lock.acquire():
+            wait_start = time.time()
+            lock.wait(self._lock_timeout)
+
+            shared = self._cache.get(cache_key)
+            if shared is not None \
+              and shared[0]['stored'] >= wait_start:
+                return CachedResponse(*shared), 'shared'
+
+            # No luck in the other process, fetch it here
+            url, cache_key, entry, headers = self._prepare_request(action, params, url_params, True)
+            lock.acquire()
+
+        try:
+            r = self._get(url, params, headers, stream)
+
+            if r.status_code == 304 \
+              and entry is not None:
+                r.close()
+                self._cache.update_meta(cache_key, stored=time.time())
+                return CachedResponse(*entry), 'revalidated'
+
+            meta = self._response_meta(r.url, r.headers)
+            if stream:
+                response = CachingResponse(r, self._cache, cache_key, meta, lock)
+                lock = None
+                return response, 'miss'
+
+            self._cache.set(cache_key, r.content, meta)
+        finally:
+            if lock is not None:
+                lock.release()
+
+        return r, 'miss'
+
+    def _get_lock(self, cache_key):
+        return FileLock(os.path.join(self._locks_dir, cache_key + '.lock'), self._lock_timeout * 2)
+
+    def _prepare_request(self, action, params, url_params, revalidate=False):
+        """Return ``(url, cache_key, entry, headers)`` of the request
+
+        ``cache_key`` is None when the action is not cached, ``headers``
+        is None when the cached ``entry`` is to be served without a
+        request. Otherwise headers carry the validators of the entry.
+
+        Entries of 'stale' actions up to ``max_stale`` seconds past their
+        ttl are served as well and queued for revalidate_stale().
+        """
         action_settings = self._actions.get(action)
         
         if isinstance(action_settings, dict):
             url = action_settings['url']
+            cache_ttl = action_settings.get('cache_ttl', 0)
         else:
             url = action_settings
+            cache_ttl = 0
 
         if url_params is not None:
-            for key, val in iteritems(url_params):
+            for key, val in url_params.items():
                 url = url.replace('#{0}'.format(key), str(val))
 
+        if self._cache is None \
+          or not cache_ttl:
+            return url, None, None, self._headers
+
+        cache_key = FileCache.make_key(action, url_params or {}, params)
+        entry = self._cache.get(cache_key)
+
+        headers = self._headers
+        if entry is not None:
+            meta, content = entry
+            age = time.time() - meta['stored']
+            if not self._refresh \
+              and not revalidate:
+                if age < cache_ttl:
+                    return url, cache_key, entry, None
+                if action_settings.get('stale') \
+                  and age < cache_ttl + self._max_stale:
+                    self._stale.setdefault(cache_key, (action, params, url_params))
+                    return url, cache_key, entry, None
+
+            headers = dict(self._headers)
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        return url, cache_key, entry, headers
+
+    @staticmethod
+    def _response_meta(url, headers):
+        return {'url': url,
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                }
+
+    def _get(self, url, params, headers, stream=False):
         try:
-            r = requests.get(url, params=params, headers=self._headers)
+            r = self._get_session().get(url, params=params, headers=headers, timeout=self._timeout, stream=stream)
             r.raise_for_status()
-        except requests.ConnectionError:
+        except (requests.ConnectionError, requests.Timeout):
             raise NTVApiError('Connection error')
 
         return r
 
     @staticmethod
-    def _extract_json(r):
+    def _wire_bytes(r):
+        """Size of the response body read from the network, before
+        decompression. Zero for responses restored from the cache"""
+        raw = getattr(r, 'raw', None)
+        if raw is None:
+            return 0
+
+        try:
+            return raw.tell()
+        except (AttributeError, IOError):
+            return int(r.headers.get('Content-Length') or 0)
+
+    def _get_session(self):
+        if self._session is not None:
+            return self._session
+
+        session_key = (self._retries, self._backoff_factor, self._pool_size)
+        if self._keep_session \
+          and _sessions.get(session_key) is not None:
+            self._session = _sessions[session_key]
+            return self._session
+
+        from requests.adapters import HTTPAdapter
+        from requests.packages.urllib3.util.retry import Retry
+
+        retry = Retry(total=self._retries,
+                      connect=self._retries,
+                      read=self._retries,
+                      backoff_factor=self._backoff_factor,
+                      status_forcelist=(500, 502, 503, 504),
+                      raise_on_status=False,
+                      )
+        adapter = HTTPAdapter(pool_connections=self._pool_size,
+                              pool_maxsize=self._pool_size,
+                              max_retries=retry,
+                              )
+
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        self._session = session
+        if self._keep_session:
+            _sessions[session_key] = session
+
+        return session
+
+    def _extract_json(self, r, action):
+        start = time.time()
         try:
             json = r.json()
         except ValueError as err:
             raise NTVApiError(err)
+        finally:
+            self.profiler.record(action, 'decode', time.time() - start)
 
         return json
 
+    def _extract_data(self, r, action, project):
+        """``data`` of the JSON response reduced to the fields the plugin reads
+
+        The reduced data is kept as a snapshot keyed by the hash of the
+        response body, so a cached response is decoded only once.
+        """
+        if self._cache is None:
+            return self._extract_json(r, action)['data']
+
+        key = FileCache.make_key('snapshot', action, hashlib.sha1(r.content).hexdigest())
+        if isinstance(r, CachedResponse):
+            start = time.time()
+            entry = self._cache.get(key)
+            data = snapshot.loads(entry[1]) if entry is not None else None
+            if data is not None:
+                self.profiler.record(action, 'decode', time.time() - start)
+                return data
+
+        data = project(self._extract_json(r, action)['data'])
+        self._cache.set(key, snapshot.dumps(data))
+
+        return data
+
+    def _iter_json(self, r, paths, action):
+        """Streamed counterpart of _extract_json, decode time includes
+        reading the response body"""
+        elapsed = 0
+        size = [0]
+
+        def count_bytes(chunks):
+            for chunk in chunks:
+                size[0] += len(chunk)
+                yield chunk
+
+        try:
+            chunks = count_bytes(r.iter_content(16384))
+            items = jsonstream.iterparse(chunks, paths)
+            while True:
+                start = time.time()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.time() - start
+                yield item
+
+            # Read the response up to the end, so it gets into the cache
+            start = time.time()
+            for chunk in chunks:
+                pass
+            elapsed += time.time() - start
+        except ValueError as err:
+            raise NTVApiError(err)
+        except requests.RequestException:
+            raise NTVApiError('Connection error')
+        finally:
+            wire_bytes = self._wire_bytes(r)
+            r.close()
+            self.profiler.record(action, 'decode', elapsed, bytes=size[0], wire_bytes=wire_bytes)
+
     @staticmethod
     def _get_menu(data, menu_type):
         menus = data['menus']
@@ -80,12 +499,47 @@ def _get_menu(data, menu_type):
         
         return result
 
-    def get_genres(self):
-        r = self._http_request('main')
+    def _get_catalog(self):
+        if self._catalog is None:
+            r = self._http_request('main')
+            data = self._extract_data(r, 'main', snapshot.project_catalog)
+
+            self._set_catalog(data, isinstance(r, CachedResponse))
 
-        json = self._extract_json(r)
+        return self._catalog
+
+    def _set_catalog(self, data, cached=False):
+        self._catalog = Catalog(data)
+
+        if self._cache is not None:
+            generation = self._get_programs_generation()
+            # Program pages sliced from the previous catalog are outdated now
+            if not cached:
+                generation += 1
+                self._cache.set(self._generation_key, '{0}'.format(generation).encode('utf-8'))
+            if not cached \
+              or self._get_cached_genre_ids() is None:
+                self._cache.set(FileCache.make_key('genre_ids', generation),
+                                snapshot.dumps(self._catalog.get_genre_ids()))
+
+        if cached:
+            return
+
+        # Cached responses are in the search index already
+        if self._search is not None:
+            self._index_programs(self._catalog.get_programs())
+
+    def _get_programs_generation(self):
+        entry = self._cache.get(self._generation_key)
+        try:
+            return int(entry[1]) if entry is not None else 0
+        except ValueError:
+            return 0
+
+    def get_genres(self):
+        catalog = self._get_catalog()
 
-        for index, genre in enumerate(json['data']['genres']):
+        for index, genre in enumerate(catalog.genres):
             item = {'title': genre['title'],
                     'id': index,
                     }
@@ -98,45 +552,157 @@ def browse_programs(self, genre_id, params=None):
         offset = int(params.get('offset', '0'))
         limit = int(params.get('limit', '10'))
 
+        if params.get('cursor'):
+            limit, page_no = self._parse_cursor(params['cursor'])
+            offset = page_no * limit
+
         if isinstance(genre_id, basestring):
             genre_id = int(genre_id)
 
-        r = self._http_request('main')
-
-        json = self._extract_json(r)
+        if offset % limit == 0:
+            page = self._get_programs_page(genre_id, limit, offset // limit)
+            programs = page['programs']
+            total = page['total']
+            title = page['title']
+            prev_cursor = self._make_cursor(limit, offset // limit - 1) if offset > 0 else None
+            next_cursor = self._make_cursor(limit, offset // limit + 1) if offset + limit < total else None
+        else:
+            genre = self._get_catalog().get_genre(genre_id)
+            programs = genre['programs'][offset:(offset + limit)]
+            total = len(genre['programs'])
+            title = genre['title']
+            prev_cursor = None
+            next_cursor = None
 
-        genre = json['data']['genres'][genre_id]
-        
-        result = {'count': min(limit, len(genre['programs']) - offset),
-                  'total': len(genre['programs']),
+        result = {'count': len(programs),
+                  'total': total,
                   'offset': offset,
                   'limit': limit,
-                  'title': genre['title'],
-                  'list': self._programs_list(genre['programs'], offset, limit),
+                  'title': title,
+                  'prev_cursor': prev_cursor,
+                  'next_cursor': next_cursor,
+                  'digest': self._digest([programs, offset, limit, total]),
+                  'list': self.profiler.timed_iter('main', self._programs_list(programs, 0, limit)),
                   }
         return result
 
+    def _get_programs_page(self, genre_id, limit, page_no):
+        """Page of the genre programs from the pre-sliced program index
+
+        The index is built from the catalog on first use and stored page
+        by page, so later page turns do not need the main document.
+        """
+        if self._cache is not None:
+            page_key = FileCache.make_key('programs', self._get_programs_generation(), genre_id, limit, page_no)
+            entry = self._cache.get(page_key) if not self._refresh else None
+            if entry is not None:
+                meta, content = entry
+                if time.time() - meta['stored'] < self._actions['main']['cache_ttl']:
+                    page = snapshot.loads(content)
+                    if page is not None:
+                        return page
+        else:
+            page_key = FileCache.make_key('programs', genre_id, limit, page_no)
+            if page_key in self._program_pages \
+              and not self._refresh:
+                return self._program_pages[page_key]
+
+        genre = self._get_catalog().get_genre(genre_id)
+        programs = snapshot.project_programs(genre['programs'])
+
+        generation = self._get_programs_generation() if self._cache is not None else None
+
+        result = None
+        for index, page_offset in enumerate(range(0, max(len(programs), 1), limit)):
+            page = {'title': genre['title'],
+                    'total': len(programs),
+                    'programs': programs[page_offset:(page_offset + limit)],
+                    }
+            if self._cache is not None:
+                key = FileCache.make_key('programs', generation, genre_id, limit, index)
+                self._cache.set(key, snapshot.dumps(page))
+            else:
+                key = FileCache.make_key('programs', genre_id, limit, index)
+                self._program_pages[key] = page
+
+            if index == page_no:
+                result = page
+
+        if result is None:
+            result = {'title': genre['title'],
+                      'total': len(programs),
+                      'programs': [],
+                      }
+        return result
+
+    @staticmethod
+    def _make_cursor(limit, page_no):
+        return '{0}.{1}'.format(limit, page_no)
+
+    @staticmethod
+    def _parse_cursor(cursor):
+        try:
+            limit, page_no = [int(part) for part in cursor.split('.')]
+        except ValueError:
+            raise NTVApiError('Invalid page cursor')
+
+        if limit < 1 \
+          or page_no < 0:
+            raise NTVApiError('Invalid page cursor')
+
+        return limit, page_no
+
     @staticmethod
     def _programs_list(programs, offset, limit):
         for program in programs[offset:(offset + limit)]:
-            item = {'annotation': program['annotation'],
-                    'id': program['id'],
-                    'img': program['img'],
-                    'shortcat': program['shortcat'],
-                    'rating': NTV._get_rating(program['r']),
-                    'title': program['title'],
-                    }
+            item = Program(annotation=program['annotation'],
+                           id=program['id'],
+                           img=program['img'],
+                           shortcat=program['shortcat'],
+                           rating=NTV._get_rating(program['r']),
+                           title=program['title'],
+                           )
             yield(item)
 
+    def get_genre_id(self, title):
+        # Genre ids are stored along with the pre-sliced program pages,
+        # so a page turn does not need the main document
+        if self._catalog is None \
+          and self._cache is not None \
+          and not self._refresh:
+            genre_ids = self._get_cached_genre_ids()
+            if genre_ids is not None:
+                return genre_ids.get(title)
+
+        return self._get_catalog().get_genre_id(title)
+
+    def _get_cached_genre_ids(self):
+        entry = self._cache.get(FileCache.make_key('genre_ids', self._get_programs_generation()))
+        if entry is None:
+            return None
+
+        meta, content = entry
+        if time.time() - meta['stored'] >= self._actions['main']['cache_ttl']:
+            return None
+        return snapshot.loads(content)
+
+    def get_program(self, prog_id):
+        program = self._get_catalog().get_program(prog_id)
+        if program is None:
+            return None
+
+        return next(self._programs_list([program], 0, 1))
+
     def browse_seasons(self, prog_id):
 
         url_params = {'prog_id': prog_id}
 
         r = self._http_request('program', url_params=url_params)
-        json = self._extract_json(r)
+        data = self._extract_data(r, 'program', snapshot.project_program_data)
 
-        data = json['data']
+        return self._seasons_result(data)
 
+    def _seasons_result(self, data):
         abouts = self._get_menu(data, 'about')
         if abouts:
             description = abouts[0]['txt']
@@ -153,7 +719,8 @@ def browse_seasons(self, prog_id):
                   'annotation': data['annotation'],
                   'description': description,
                   'img': data['preview'],
-                  'list': self._season_list(archives)
+                  'digest': self._digest(data),
+                  'list': self.profiler.timed_iter('program', self._season_list(archives))
                   }
 
         return result
@@ -161,83 +728,311 @@ def browse_seasons(self, prog_id):
     @staticmethod
     def _season_list(archives):
         for archive in archives:
-            item = {'title': archive['title'],
-                    'id': archive['id'],
-                    }
+            item = Season(title=archive['title'],
+                          id=archive['id'],
+                          )
             yield item
 
-    def browse_episodes(self, prog_id, archive_id):
-
-        issues = []
+    def browse_episodes(self, prog_id, archive_id, params=None):
+        params = params or {}
 
         url_params = {'prog_id': prog_id,
                       'archive_id': archive_id}
 
-        u_params = {'limit': 100, 'offset': 1}
-        
-        while True:
-            r = self._http_request('archive', u_params, url_params)
-            json = self._extract_json(r)
-    
-            data = json['data']
-            archive = data.get('archive')
-            if archive is None:
-                break
+        data = self._get_archive_page(url_params, 1)
+        archive = data.get('archive')
 
-            issue_count = archive['issue_count']
-            
-            for issue in archive['issues']:
-                issues.append(issue)
-            
-            u_params['offset'] += u_params['limit']
-            
-            if issue_count < u_params['offset']:
-                break 
+        digest = None
+        if archive is None:
+            issues = []
+            count = 0
+        elif self._archives is not None:
+            key = FileCache.make_key(prog_id, archive_id)
+            entry = self._archives.get(key)
+            known = snapshot.loads(entry[1]) if entry is not None else None
+            if known is None \
+              and params.get('stream'):
+                issues = self._stream_to_archive(key, url_params, archive)
+                count = archive['issue_count']
+            else:
+                issues, digest = self._sync_archive(key, url_params, archive, entry, known)
+                digest = self._digest([digest, data['title'], data['annotation'], data['r']])
+                count = len(issues)
+        elif params.get('stream'):
+            issues = self._stream_issues(url_params, archive)
+            count = archive['issue_count']
+        else:
+            issues = []
+            for page in self._archive_pages(url_params, archive):
+                issues.extend(page)
+            issues.sort(key=NTV._sort_by_ts)
+            count = len(issues)
 
-        issues.sort(key=NTV._sort_by_ts)
+        return self._episodes_result(data, issues, count, digest)
 
-        result = {'count': len(issues),
+    def _episodes_result(self, data, issues, count, digest=None):
+        result = {'count': count,
+                  'digest': digest,
                   'title': data['title'],
                   'type': data['type'],
                   'shortcat': data['shortcat'],
                   'rating': self._get_rating(data['r']),
                   'annotation': data['annotation'],
-                  'list': self._episode_list(issues)
+                  'list': self.profiler.timed_iter('archive', self._episode_list(issues))
                   }
 
         return result
 
+    def _sync_archive(self, key, url_params, archive, entry, known):
+        """All issues of the archive sorted by timestamp along with the
+        digest of the stored archive
+
+        Issues seen before are kept in the local archive store, so only
+        the pages with issues added since the last visit are requested.
+        ``entry`` and ``known`` are the store entry and its data, if any.
+        """
+        issues = None
+        if known is not None:
+            issues = self._merge_new_issues(url_params, archive, known)
+
+        if issues is not None:
+            new_issues = issues[len(known['issues']):]
+        else:
+            issues = []
+            for page in self._archive_pages(url_params, archive):
+                issues.extend(page)
+            issues.sort(key=NTV._sort_by_ts)
+            new_issues = issues
+
+        if known is None \
+          or known['issue_count'] != archive['issue_count'] \
+          or len(known['issues']) != len(issues):
+            content = self._store_archive(key, archive, issues, new_issues)
+        else:
+            content = entry[1]
+
+        return issues, hashlib.sha1(content).hexdigest()
+
+    def _stream_to_archive(self, key, url_params, archive):
+        """Issues streamed by _stream_issues, put in the local archive
+        store once all of them are read"""
+        issues = []
+        for issue in self._stream_issues(url_params, archive):
+            issues.append(issue)
+            yield issue
+
+        # The store has to be sorted, the stream may be not
+        issues.sort(key=NTV._sort_by_ts)
+        self._store_archive(key, archive, issues)
+
+    def _store_archive(self, key, archive, issues, new_issues=None):
+        """Store the issues, ``new_issues`` are the ones not indexed yet
+        (all of them by default)"""
+        store = {'issue_count': archive['issue_count'],
+                 'issues': snapshot.project_issues(issues),
+                 }
+        content = snapshot.dumps(store)
+        self._archives.set(key, content)
+        self._index_issues(issues if new_issues is None else new_issues)
+
+        return content
+
+    def _merge_new_issues(self, url_params, archive, known):
+        """Known issues with the new ones appended or None when the
+        archive has to be loaded in full"""
+        new_count = archive['issue_count'] - known['issue_count']
+        known_issues = known['issues']
+        if new_count < 0 \
+          or not known_issues:
+            return None
+
+        newest_ts = known_issues[-1]['ts']
+
+        # New issues come first in newest-first archives and last otherwise.
+        # The range includes the newest known issue to make sure there is no gap.
+        first_page = archive['issues']
+        if len(first_page) > 1 \
+          and first_page[0]['ts'] < first_page[-1]['ts']:
+            start = known['issue_count']
+        else:
+            start = 1
+
+        fetched = self._get_archive_range(url_params, archive, start, new_count + 1)
+        if not any(issue['ts'] == newest_ts for issue in fetched):
+            return None
+
+        new_issues = [issue for issue in fetched if issue['ts'] > newest_ts]
+        if len(new_issues) != new_count:
+            return None
+
+        new_issues.sort(key=NTV._sort_by_ts)
+        return known_issues + new_issues
+
+    def _get_archive_range(self, url_params, archive, start, count):
+        """Issues at positions [start, start + count) of the archive"""
+        result = archive['issues'][(start - 1):(start - 1 + count)]
+
+        position = start + len(result)
+        end = start + count
+        while position < end:
+            data = self._get_archive_page(url_params, position, min(end - position, self._archive_limit))
+            page = data.get('archive')
+            if page is None \
+              or not page['issues']:
+                break
+            result.extend(page['issues'])
+            position += len(page['issues'])
+
+        return result
+
+    def _archive_pages(self, url_params, archive, reverse=False):
+        """Issue lists of all archive pages, starting from the already
+        loaded first page (or ending with it when ``reverse`` is set)"""
+        limit = self._archive_limit
+        offsets = list(range(1 + limit, archive['issue_count'] + 1, limit))
+
+        if not reverse:
+            yield archive['issues']
+        else:
+            offsets.reverse()
+
+        get_page = lambda offset: self._get_archive_page(url_params, offset)
+        for page in workers.imap(get_page, offsets, self._workers):
+            page_archive = page.get('archive')
+            if page_archive is None:
+                break
+            yield page_archive['issues']
+
+        if reverse:
+            yield archive['issues']
+
+    def _stream_issues(self, url_params, archive):
+        """Issues yielded page by page, in timestamp order as long as the
+        API keeps to it
+
+        When the first page shows that the API returns issues in
+        timestamp order, pages are requested in that order (last page
+        first for newest-first archives) and each page is sorted on its
+        own. If a later page breaks the order, the issues yielded so far
+        stay as they are and only the remaining pages are merged, so the
+        result is not sorted then. Kodi sorts the directory by date anyway.
+        Without an order on the first page all pages are loaded and
+        combined with a heap merge.
+        """
+        first_page = archive['issues']
+        if len(first_page) > 1 \
+          and first_page[0]['ts'] > first_page[-1]['ts']:
+            pages = self._archive_pages(url_params, archive, reverse=True)
+        elif self._is_sorted(first_page):
+            pages = self._archive_pages(url_params, archive)
+        else:
+            pages = None
+
+        if pages is not None:
+            last_ts = None
+            for page in pages:
+                page = sorted(page, key=NTV._sort_by_ts)
+                if page \
+                  and last_ts is not None \
+                  and page[0]['ts'] < last_ts:
+                    # API order turned out not to be monotonic. Yielded issues
+                    # can not be taken back, only the rest is merged.
+                    pages = itertools.chain([page], pages)
+                    break
+                for issue in page:
+                    yield issue
+                if page:
+                    last_ts = page[-1]['ts']
+            else:
+                return
+        else:
+            pages = self._archive_pages(url_params, archive)
+
+        sorted_pages = [self._decorate_page(sorted(page, key=NTV._sort_by_ts), index)
+                        for index, page in enumerate(pages)]
+        for item in heapq.merge(*sorted_pages):
+            yield item[-1]
+
+    @staticmethod
+    def _decorate_page(page, page_index):
+        for index, issue in enumerate(page):
+            yield (issue['ts'], page_index, index, issue)
+
+    @staticmethod
+    def _is_sorted(issues):
+        for prev, issue in zip(issues, issues[1:]):
+            if prev['ts'] > issue['ts']:
+                return False
+        return True
+
+    def _get_archive_page(self, url_params, offset, limit=None):
+        u_params = {'limit': limit or self._archive_limit,
+                    'offset': offset,
+                    }
+
+        if not self._stream_json:
+            r = self._http_request('archive', u_params, url_params)
+            json = self._extract_json(r, 'archive')
+
+            return json['data']
+
+        r = self._http_request('archive', u_params, url_params, stream=True)
+        # The whole body is at hand already, json decodes it much faster
+        if isinstance(r, CachedResponse):
+            return self._extract_json(r, 'archive')['data']
+
+        data = {}
+        for path, value in self._iter_json(r, self._archive_paths, 'archive'):
+            if path[1] != 'archive':
+                data[path[1]] = value
+            elif path[2] == 'issue_count':
+                data.setdefault('archive', {'issues': []})['issue_count'] = value
+            else:
+                data.setdefault('archive', {'issues': []})['issues'].append(value)
+
+        return data
+
     @staticmethod
     def _episode_list(issues):
 
         for issue in issues:
-            if len(issue['video_list']) == 1:
-                video = issue['video_list'][0]
-                yield NTV._video_item(issue, video)
+            videos = list(NTV._issue_videos(issue))
+            if len(videos) > 1:
+                parts = tuple(video['id'] for video, part in videos)
             else:
-                for part, video in enumerate(issue['video_list']):
-                    yield NTV._video_item(issue, video, part + 1)
+                parts = None
+
+            for video, part in videos:
+                yield NTV._video_item(issue, video, part, parts)
 
     @staticmethod
-    def _video_item(issue, video, part=None):
-
-        item = {'program_title': issue.get('program_title', ''),
-                'title': issue.get('title', ''),
-                'description': issue.get('txt', ''),
-                'rating': NTV._get_rating(video['r']),
-                'allowed': video['allowed'],
-                'img': video['img'],
-                'id': video['id'],
-                'timestamp': float(video['ts']) / 1000
-                ,
-                'duration': video['tt'],
-                'subtitles': video.get('subtitles'),
-                'episode': None,  # NTV._comScore_val(video['comScore'], 'ns_st_en'),
-                'season': None,  # NTV._comScore_val(video['comScore'], 'ns_st_sn'),
-                'genre': None,  # NTV._comScore_val(video['comScore'], 'ns_st_ge'),
-                'part': part,
-                # 'date': video['comScore']['ns_st_ddt'],
-                }
+    def _issue_videos(issue):
+        if len(issue['video_list']) == 1:
+            yield issue['video_list'][0], None
+        else:
+            for part, video in enumerate(issue['video_list']):
+                yield video, part + 1
+
+    @staticmethod
+    def _video_item(issue, video, part=None, parts=None):
+
+        item = Episode(program_title=issue.get('program_title', ''),
+                       title=issue.get('title', ''),
+                       description=issue.get('txt', ''),
+                       rating=NTV._get_rating(video['r']),
+                       allowed=video['allowed'],
+                       img=video['img'],
+                       id=video['id'],
+                       timestamp=float(video['ts']) / 1000,
+                       duration=video['tt'],
+                       subtitles=video.get('subtitles'),
+                       part=part,
+                       parts=parts,
+                       # episode: NTV._comScore_val(video['comScore'], 'ns_st_en'),
+                       # season: NTV._comScore_val(video['comScore'], 'ns_st_sn'),
+                       # genre: NTV._comScore_val(video['comScore'], 'ns_st_ge'),
+                       # date: video['comScore']['ns_st_ddt'],
+                       )
         return item
 
     @staticmethod
@@ -261,9 +1056,12 @@ def get_video_info(self, video_id):
         url_params = {'video_id': video_id}
 
         r = self._http_request('video', url_params=url_params)
-        json = self._extract_json(r)
+        json = self._extract_json(r, 'video')
 
-        info = json['info']
+        return self._video_info_result(json['info'])
+
+    @staticmethod
+    def _video_info_result(info):
         if info['linked_entities'].get('linked_issues') is not None:
             issue = info['linked_entities']['linked_issues'][0]
         else:
@@ -273,7 +1071,231 @@ def get_video_info(self, video_id):
                   'hi_video': info.get('hi_video', ''),
             }
         return result
+
+    def get_video_infos(self, video_ids, skip_errors=False):
+        """Resolve video info for many ids concurrently
+
+        Results are returned in the order of ``video_ids``. Repeated ids
+        are requested once, cached responses are reused. With
+        ``skip_errors`` ids that failed to resolve get None instead of
+        raising the first error.
+        """
+        video_ids = ['{0}'.format(video_id) for video_id in video_ids]
+
+        unique_ids = []
+        seen = set()
+        for video_id in video_ids:
+            if video_id not in seen:
+                seen.add(video_id)
+                unique_ids.append(video_id)
+
+        asyncntv = self._get_asyncntv()
+        if asyncntv is not None:
+            return asyncntv.run(self, 'get_video_infos', video_ids, skip_errors)
+
+        if skip_errors:
+            get_info = self._get_video_info_or_none
+        else:
+            get_info = self.get_video_info
+
+        infos = dict(zip(unique_ids, workers.imap(get_info, unique_ids, self._workers)))
+
+        return [infos[video_id] for video_id in video_ids]
+
+    def _get_asyncntv(self):
+        """The asyncntv module when batches are to be run on AsyncNTV,
+        i.e. on Python 3 with aiohttp installed"""
+        if not self._async_batch:
+            return None
+
+        from . import asyncntv
+        return asyncntv if asyncntv.available else None
+
+    def _get_video_info_or_none(self, video_id):
+        try:
+            return self.get_video_info(video_id)
+        except (NTVApiError, requests.RequestException, KeyError, IndexError):
+            return None
+
+    def warm_up(self, genres=(), archives=(), limit=10):
+        """Refresh cached data used by the browse routes
+
+        Revalidates the catalog, the first program page of the genres
+        with the given titles along with the pages of these programs, and
+        the first page of every (prog_id, archive_id) archive.
+        """
+        catalog = self._get_catalog()
+
+        programs = []
+        for title in genres:
+            genre_id = catalog.get_genre_id(title)
+            if genre_id is not None:
+                page = self._get_programs_page(genre_id, limit, 0)
+                programs.extend(program['shortcat'] for program in page['programs'])
+
+        workers.map(self._warm_up_program, programs, self._workers)
+        workers.map(self._warm_up_archive, archives, self._workers)
+
+    def _warm_up_program(self, prog_id):
+        url_params = {'prog_id': prog_id}
+
+        try:
+            r = self._http_request('program', url_params=url_params)
+            r.close()
+        except (NTVApiError, requests.RequestException):
+            pass
+
+    def _warm_up_archive(self, archive):
+        url_params = {'prog_id': archive[0],
+                      'archive_id': archive[1],
+                      }
+
+        try:
+            self._get_archive_page(url_params, 1)
+        except (NTVApiError, requests.RequestException):
+            pass
+
+    def search(self, query, limit=50):
+        """Search programs and episodes in the local search index"""
+        programs = []
+        episodes = []
+        if self._search is not None:
+            for kind, data in self._search.search(query, limit):
+                if kind == 'program':
+                    programs.append(data)
+                else:
+                    episodes.append(data)
+
+        result = {'count': len(programs) + len(episodes),
+                  'programs': self._programs_list(programs, 0, len(programs)),
+                  'episodes': self._indexed_episodes(episodes),
+                  }
+        return result
+
+    @staticmethod
+    def _indexed_episodes(episodes):
+        for episode in episodes:
+            yield NTV._video_item(episode['issue'], episode['video'], episode['part'])
+
+    def _index_programs(self, programs):
+        items = []
+        for program in programs:
+            data = dict((key, program[key]) for key in ('annotation', 'id', 'img', 'shortcat', 'r', 'title'))
+            items.append((program['shortcat'], program['title'], program['annotation'], data))
+
+        self._add_to_search('program', items)
+
+    def _index_issues(self, issues):
+        items = []
+        for issue in issues:
+            for video, part in self._issue_videos(issue):
+                data = {'issue': dict((key, issue.get(key, '')) for key in ('program_title', 'title', 'txt')),
+                        'video': dict((key, video.get(key)) for key in ('r', 'allowed', 'img', 'id', 'ts', 'tt', 'subtitles')),
+                        'part': part,
+                        }
+                items.append((video['id'], issue.get('title', ''), issue.get('txt', ''), data))
+
+        self._add_to_search('episode', items)
+
+    def _add_to_search(self, kind, items):
+        if not items:
+            return
+
+        import sqlite3
+
+        # Listings must not fail because of the index, e.g. when another
+        # process keeps it locked for too long. Such items are added to
+        # the index on the next full load of their archive.
+        start = time.time()
+        try:
+            self._search.add(kind, items)
+        except sqlite3.OperationalError:
+            self.profiler.record('search', 'build', time.time() - start, error=True)
+
+    def prefetch_video_info(self, video_ids):
+        """Store video info for the ids in the cache ahead of playback"""
+        if self._cache is None:
+            return
+
+        asyncntv = self._get_asyncntv()
+        if asyncntv is not None:
+            asyncntv.run(self, 'get_video_infos', video_ids, True)
+            return
+
+        workers.map(self._prefetch_video, video_ids, self._workers)
+
+    def _prefetch_video(self, video_id):
+        url_params = {'video_id': video_id}
+
+        try:
+            r = self._http_request('video', url_params=url_params)
+            r.close()
+        except (NTVApiError, requests.RequestException):
+            pass
         
+    def get_artwork(self, url):
+        """Local copy of the image if it is in the artwork cache, the url otherwise"""
+        if self._artwork is None \
+          or not url:
+            return url
+
+        return self._artwork.get_path(url) or url
+
+    def prefetch_artwork(self, urls):
+        """Download images missing in the artwork cache"""
+        if self._artwork is None:
+            return
+
+        missing = []
+        seen = set()
+        for url in urls:
+            if url \
+              and url not in seen \
+              and self._artwork.get_path(url, touch=False) is None:
+                missing.append(url)
+            seen.add(url)
+
+        if missing:
+            workers.map(self._prefetch_image, missing, self._workers)
+            self._artwork.evict()
+
+    def _prefetch_image(self, url):
+        start = time.time()
+        try:
+            r = self._get(url, None, self._headers)
+        except (NTVApiError, requests.RequestException):
+            self.profiler.record('artwork', 'fetch', time.time() - start, error=True)
+            return
+
+        self._artwork.add(url, r.content)
+        self.profiler.record('artwork', 'fetch', time.time() - start, status=r.status_code,
+                             bytes=len(r.content), wire_bytes=self._wire_bytes(r))
+
+    def revalidate_stale(self):
+        """Revalidate the cache entries that were served outdated, so the
+        next run gets current data. Meant to be called once the results
+        are shown."""
+        stale = list(self._stale.values())
+        self._stale.clear()
+
+        workers.map(self._revalidate, stale, self._workers)
+
+    def _revalidate(self, request):
+        action, params, url_params = request
+
+        try:
+            r = self._http_request(action, params, url_params, revalidate=True)
+            if action == 'main' \
+              and not isinstance(r, CachedResponse):
+                self._set_catalog(self._extract_data(r, 'main', snapshot.project_catalog))
+        except (NTVApiError, requests.RequestException):
+            pass
+
+    @staticmethod
+    def _digest(data):
+        """Hash of the API data a result is built from"""
+        return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
     def _get_season(self, title):
         parts = title.split('-')
         if parts[-1].isdigit():
@@ -282,25 +1304,26 @@ def _get_season(self, title):
             result = 1
         return result
 
+    # MPAA rating by the age category of the API
+    _mpaa = {1: 'PG',
+             2: 'PG-13',
+             3: 'R',
+             4: 'NC-17',
+             }
+
+    # Shared Rating objects by (k, v) of the API rating
+    _ratings = {}
+
     @staticmethod
     def _get_rating(rating):
-        rars = rating['v']
-        if rating['k'] <= 0:
-            mpaa = 'G'
-            rars = '0+'
-        elif rating['k'] == 1:
-            mpaa = 'PG'
-        elif rating['k'] == 2:
-            mpaa = 'PG-13'
-        elif rating['k'] == 3:
-            mpaa = 'R'
-        elif rating['k'] == 4:
-            mpaa = 'NC-17'
-        else:
-            mpaa = ''
-        
-        result = {'rars': rars,
-                  'mpaa': mpaa,
-                  }
-        
+        key = (rating['k'], rating['v'])
+
+        result = NTV._ratings.get(key)
+        if result is None:
+            if rating['k'] <= 0:
+                result = Rating(rars='0+', mpaa='G')
+            else:
+                result = Rating(rars=rating['v'], mpaa=NTV._mpaa.get(rating['k'], ''))
+            result = NTV._ratings.setdefault(key, result)
+
         return result
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# Module: profiler
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import time
+import threading
+
+
+class Profiler(object):
+    """Per-action counters and timings of the NTV client
+
+    Stages are ``fetch`` (HTTP request or cache lookup), ``decode`` (JSON
+    decoding) and ``build`` (iterating over the resulting items). Hooks
+    are called with an event dict for every recorded stage.
+
+    ``bytes`` counts decoded response bodies, ``wire_bytes`` what was
+    actually transferred, i.e. compressed and without cache hits and
+    304 responses.
+    """
+
+    _counters = ('requests', 'cache_hits', 'errors', 'bytes', 'wire_bytes')
+    _stages = ('fetch', 'decode', 'build')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._hooks = []
+
+    def add_hook(self, hook):
+        self._hooks.append(hook)
+
+    def record(self, action, stage, elapsed, **info):
+        with self._lock:
+            stats = self._stats.get(action)
+            if stats is None:
+                stats = dict.fromkeys(self._counters + self._stages, 0)
+                self._stats[action] = stats
+
+            stats[stage] += elapsed
+            if stage == 'fetch':
+                stats['requests'] += 1
+            if info.get('cache') in ('hit', 'stale', 'shared', 'revalidated'):
+                stats['cache_hits'] += 1
+            if info.get('error'):
+                stats['errors'] += 1
+            stats['bytes'] += info.get('bytes', 0)
+            stats['wire_bytes'] += info.get('wire_bytes', 0)
+
+        if self._hooks:
+            event = dict(info, action=action, stage=stage, elapsed=elapsed)
+            for hook in self._hooks:
+                hook(event)
+
+    def timed_iter(self, action, items):
+        """Iterate over items recording time spent in producing them"""
+        elapsed = 0
+        items = iter(items)
+        try:
+            while True:
+                start = time.time()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.time() - start
+                yield item
+        finally:
+            self.record(action, 'build', elapsed)
+
+    def get_stats(self):
+        with self._lock:
+            return dict((action, dict(stats)) for action, stats in self._stats.items())
+
+    def format_stats(self):
+        lines = []
+        for action, stats in sorted(self.get_stats().items()):
+            lines.append('{0}: {1} requests, {2} cache hits, {3} errors, {4} bytes ({5} on the wire), '
+                         'fetch {6:.3f} s, decode {7:.3f} s, build {8:.3f} s'.format(
+                            action, stats['requests'], stats['cache_hits'], stats['errors'], stats['bytes'],
+                            stats['wire_bytes'], stats['fetch'], stats['decode'], stats['build']))
+        return lines
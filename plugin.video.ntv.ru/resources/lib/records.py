@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Module: records
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+
+class Record(object):
+    """Compact item with read-only dict-like access to its fields"""
+
+    __slots__ = ()
+    _fields = ()
+
+    def __getitem__(self, key):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __eq__(self, other):
+        if not isinstance(other, Record):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return '{0}({1})'.format(self.__class__.__name__,
+                                 ', '.join('{0}={1!r}'.format(key, self[key]) for key in self._fields))
+
+    def get(self, key, default=None):
+        if key not in self._fields:
+            return default
+        return getattr(self, key)
+
+    def keys(self):
+        return list(self._fields)
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self._fields]
+
+    def as_dict(self):
+        return dict(self.items())
+
+
+class Rating(Record):
+    """Immutable, instances are shared between items"""
+
+    __slots__ = ('rars', 'mpaa')
+    _fields = __slots__
+
+    def __init__(self, rars, mpaa):
+        object.__setattr__(self, 'rars', rars)
+        object.__setattr__(self, 'mpaa', mpaa)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('Rating is immutable')
+
+    def __hash__(self):
+        return hash((self.rars, self.mpaa))
+
+
+class Program(Record):
+
+    __slots__ = ('annotation', 'id', 'img', 'shortcat', 'rating', 'title')
+    _fields = __slots__
+
+    def __init__(self, annotation, id, img, shortcat, rating, title):
+        self.annotation = annotation
+        self.id = id
+        self.img = img
+        self.shortcat = shortcat
+        self.rating = rating
+        self.title = title
+
+
+class Season(Record):
+
+    __slots__ = ('title', 'id')
+    _fields = __slots__
+
+    def __init__(self, title, id):
+        self.title = title
+        self.id = id
+
+
+class Episode(Record):
+
+    __slots__ = ('program_title', 'title', 'description', 'rating', 'allowed', 'img',
+                 'id', 'timestamp', 'duration', 'subtitles', 'part', 'parts')
+    _fields = __slots__ + ('episode', 'season', 'genre')
+
+    # Not provided by the API for now
+    episode = None
+    season = None
+    genre = None
+
+    def __init__(self, program_title, title, description, rating, allowed, img,
+                 id, timestamp, duration, subtitles, part=None, parts=None):
+        self.program_title = program_title
+        self.title = title
+        self.description = description
+        self.rating = rating
+        self.allowed = allowed
+        self.img = img
+        self.id = id
+        self.timestamp = timestamp
+        self.duration = duration
+        self.subtitles = subtitles
+        self.part = part
+        self.parts = parts
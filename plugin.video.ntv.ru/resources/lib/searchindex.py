@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# Module: searchindex
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import re
+import json
+import struct
+
+_word = re.compile(r'\w+', re.UNICODE)
+
+
+class SearchIndex(object):
+    """Local full-text index of programs and episodes
+
+    Items are kept in the ``items`` table as JSON and their text in the
+    ``texts`` FTS4 table sharing the same rowid. Results are ranked by the
+    number of hits, title hits weigh more than description hits. When
+    SQLite is built without FTS a plain LIKE search is used instead.
+    """
+
+    _title_weight = 10.0
+
+    def __init__(self, path):
+        self._path = path
+        self._fts = None
+
+    def _connect(self):
+        import sqlite3
+
+        conn = sqlite3.connect(self._path, timeout=10)
+        conn.create_function('rank', 1, self._rank)
+
+        if self._fts is None:
+            self._fts = self._create_tables(conn)
+
+        return conn
+
+    @staticmethod
+    def _create_tables(conn):
+        import sqlite3
+
+        conn.execute('CREATE TABLE IF NOT EXISTS items ('
+                     'id INTEGER PRIMARY KEY, kind TEXT, ref TEXT, data TEXT, UNIQUE (kind, ref))')
+
+        for tokenizer in ('unicode61', 'simple'):
+            try:
+                conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS texts '
+                             'USING fts4(title, text, tokenize={0})'.format(tokenizer))
+            except sqlite3.OperationalError:
+                continue
+            return True
+
+        conn.execute('CREATE TABLE IF NOT EXISTS texts (docid INTEGER PRIMARY KEY, title TEXT, text TEXT)')
+        return False
+
+    @classmethod
+    def _rank(cls, matchinfo):
+        # matchinfo(texts, 'pcx'): phrases, columns, then 3 ints per phrase/column
+        values = struct.unpack(str('{0}I'.format(len(matchinfo) // 4)), bytes(matchinfo))
+        phrases, columns = values[0], values[1]
+
+        score = 0.0
+        for phrase in range(phrases):
+            for column in range(columns):
+                hits = values[2 + 3 * (phrase * columns + column)]
+                score += hits * (cls._title_weight if column == 0 else 1.0)
+        return score
+
+    def add(self, kind, items):
+        """Add or replace ``(ref, title, text, data)`` items of the kind"""
+        conn = self._connect()
+        # Transactions are managed here, the write lock is taken up front
+        # as other processes may index the same items
+        conn.isolation_level = None
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for ref, title, text, data in items:
+                    ref = '{0}'.format(ref)
+                    row = conn.execute('SELECT id FROM items WHERE kind = ? AND ref = ?', (kind, ref)).fetchone()
+                    if row is not None:
+                        conn.execute('DELETE FROM texts WHERE docid = ?', (row[0],))
+                        conn.execute('DELETE FROM items WHERE id = ?', (row[0],))
+
+                    cursor = conn.execute('INSERT INTO items (kind, ref, data) VALUES (?, ?, ?)',
+                                          (kind, ref, json.dumps(data)))
+                    conn.execute('INSERT INTO texts (docid, title, text) VALUES (?, ?, ?)',
+                                 (cursor.lastrowid, title or '', text or ''))
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def search(self, query, limit=50):
+        """Return ``(kind, data)`` of the best matching items"""
+        words = _word.findall(query)
+        if not words:
+            return []
+
+        conn = self._connect()
+        try:
+            if self._fts:
+                match = ' '.join('{0}*'.format(word) for word in words)
+                rows = conn.execute('SELECT items.kind, items.data FROM texts '
+                                    'JOIN items ON items.id = texts.docid '
+                                    'WHERE texts MATCH ? '
+                                    'ORDER BY rank(matchinfo(texts, \'pcx\')) DESC LIMIT ?',
+                                    (match, limit)).fetchall()
+            else:
+                conditions = ' AND '.join(['(texts.title LIKE ? OR texts.text LIKE ?)'] * len(words))
+                args = []
+                for word in words:
+                    args.extend(['%{0}%'.format(word)] * 2)
+                rows = conn.execute('SELECT items.kind, items.data FROM texts '
+                                    'JOIN items ON items.id = texts.docid '
+                                    'WHERE {0} LIMIT ?'.format(conditions),
+                                    args + [limit]).fetchall()
+        finally:
+            conn.close()
+
+        return [(kind, json.loads(data)) for kind, data in rows]
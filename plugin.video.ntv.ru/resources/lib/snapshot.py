@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Module: snapshot
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import sys
+import struct
+import marshal
+
+# Bump when the projected fields change, older snapshots are ignored then
+SCHEMA_VERSION = 1
+
+_magic = b'NTVS'
+
+# marshal output depends on the interpreter, so it is part of the header
+_header = _magic + struct.pack(str('BBB'), SCHEMA_VERSION, sys.version_info[0], marshal.version)
+
+# Fields read by NTV._programs_list and the search index
+_program_fields = ('annotation', 'id', 'img', 'shortcat', 'r', 'title')
+
+# Fields read by NTV._video_item and the archive store
+_issue_fields = ('program_title', 'title', 'txt', 'ts')
+_video_fields = ('r', 'allowed', 'img', 'id', 'ts', 'tt', 'subtitles')
+
+# Fields read by NTV._seasons_result and NTV._season_list
+_program_data_fields = ('title', 'type', 'shortcat', 'r', 'annotation', 'preview')
+_menu_fields = {'about': ('txt',),
+                'archive': ('title', 'id'),
+                }
+
+
+def dumps(data):
+    """Snapshot bytes of projected data"""
+    return _header + marshal.dumps(data, marshal.version)
+
+
+def loads(content):
+    """Data of the snapshot or None when it is written by another schema
+    version or interpreter, or is damaged"""
+    if not content.startswith(_header):
+        return None
+
+    try:
+        return marshal.loads(content[len(_header):])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+
+def project_catalog(data):
+    return {'genres': [{'title': genre['title'],
+                        'programs': project_programs(genre['programs']),
+                        } for genre in data['genres']],
+            }
+
+
+def project_programs(programs):
+    return [_project(program, _program_fields) for program in programs]
+
+
+def project_program_data(data):
+    result = _project(data, _program_data_fields)
+    result['menus'] = [{'type': menu['type'],
+                        'data': _project(menu['data'], _menu_fields[menu['type']]),
+                        } for menu in data['menus'] if menu['type'] in _menu_fields]
+    return result
+
+
+def project_issues(issues):
+    result = []
+    for issue in issues:
+        item = _project(issue, _issue_fields)
+        item['video_list'] = [_project(video, _video_fields) for video in issue['video_list']]
+        result.append(item)
+    return result
+
+
+def _project(item, fields):
+    # Missing fields stay missing, readers tell them from empty values
+    return dict((key, item[key]) for key in fields if key in item)
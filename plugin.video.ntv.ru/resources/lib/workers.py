@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# Module: workers
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import sys
+import threading
+
+# Same as future.utils.raise_, which is slow to import
+if sys.version_info[0] >= 3:
+    def _reraise(exc_type, value, traceback):
+        raise value.with_traceback(traceback)
+else:
+    exec('def _reraise(exc_type, value, traceback):\n'
+         '    raise exc_type, value, traceback\n')
+
+
+def imap(func, items, workers=4):
+    """Ordered map over a bounded pool of threads
+
+    Results are yielded in the order of ``items`` as soon as they are
+    ready. At most ``workers`` results are computed ahead of the consumer.
+    The first exception (in the order of ``items``) is re-raised to the
+    caller and stops the remaining tasks.
+    """
+    items = list(items)
+
+    if workers < 2 \
+      or len(items) < 2:
+        for item in items:
+            yield func(item)
+        return
+
+    results = {}
+    state = {'taken': 0,
+             'consumed': 0,
+             'stop': False,
+             }
+    cond = threading.Condition()
+
+    def worker():
+        while True:
+            with cond:
+                while not state['stop'] \
+                  and state['taken'] >= state['consumed'] + workers:
+                    cond.wait()
+                if state['stop'] \
+                  or state['taken'] >= len(items):
+                    return
+                index = state['taken']
+                state['taken'] += 1
+
+            try:
+                result = (True, func(items[index]))
+            except Exception:
+                result = (False, sys.exc_info())
+
+            with cond:
+                results[index] = result
+                cond.notify_all()
+
+    for i in range(min(workers, len(items))):
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+
+    try:
+        for index in range(len(items)):
+            with cond:
+                while index not in results:
+                    cond.wait()
+                success, value = results.pop(index)
+                state['consumed'] += 1
+                cond.notify_all()
+
+            if not success:
+                _reraise(*value)
+            yield value
+    finally:
+        with cond:
+            state['stop'] = True
+            cond.notify_all()
+
+
+def map(func, items, workers=4):
+    return list(imap(func, items, workers))
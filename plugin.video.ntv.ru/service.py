@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# Module: service
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import xbmc
+
+import resources.lib.ntv as ntv
+import simplemedia
+
+addon = simplemedia.Addon()
+
+
+def warm_up():
+    with addon.get_storage('recent.pcl') as storage:
+        genres = storage.get('genres', {})
+        archives = list(storage.get('archives', []))
+
+    popular_genres = sorted(genres, key=genres.get, reverse=True)[:3]
+
+    settings = {'cache_dir': addon.profile_dir,
+                'refresh': True,
+                }
+
+    api = ntv.NTV(settings)
+    api.warm_up(popular_genres, archives, addon.get_setting('limit'))
+
+
+if __name__ == '__main__':
+    monitor = xbmc.Monitor()
+    while not monitor.abortRequested():
+        if addon.get_setting('warm_up'):
+            # A failed pass must not stop the later ones, whatever the error
+            try:
+                warm_up()
+            except Exception as err:
+                addon.log_error('Cache warm-up failed: {0}'.format(err))
+
+        if monitor.waitForAbort(addon.get_setting('warm_up_interval') * 60):
+            break
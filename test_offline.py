@@ -0,0 +1,593 @@
+# -*- coding: utf-8 -*-
+"""Tests of the NTV client that run without Kodi and network access
+
+API responses come from the local stub of the benchmarks.
+"""
+
+from __future__ import print_function, unicode_literals
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+try:
+    import mock
+except ImportError:
+    from unittest import mock
+
+cwd = os.path.dirname(os.path.abspath(__file__))
+
+addon_dir = os.path.join(cwd, 'plugin.video.ntv.ru')
+sys.path.append(addon_dir)
+
+from benchmarks.stub import StubData, StubServer, make_issue
+from resources.lib import jsonstream
+from resources.lib import workers
+from resources.lib.cache import FileCache
+from resources.lib.locks import FileLock
+from resources.lib import snapshot
+from resources.lib.searchindex import SearchIndex
+import resources.lib.ntv as ntv
+
+
+def _chunked(data, size):
+    return [data[pos:(pos + size)] for pos in range(0, len(data), size)]
+
+
+class JSONStreamTestCase(unittest.TestCase):
+
+    document = {'data': {'title': 'Программа "Тест" \\ ☃',
+                         'skipped': {'text': 'braces } ] { [ and "quotes" \\" inside', 'list': [1, [2, {}], []]},
+                         'r': {'k': 2, 'v': '12+'},
+                         'count': 1234567890,
+                         'ratio': -1.5e-3,
+                         'flags': [True, False, None],
+                         'issues': [{'id': index, 'txt': 'Выпуск \\"{0}\\"\n\té'.format(index)}
+                                    for index in range(20)],
+                         }}
+
+    paths = [('data', 'title'),
+             ('data', 'r'),
+             ('data', 'count'),
+             ('data', 'ratio'),
+             ('data', 'flags'),
+             ('data', 'issues', jsonstream.ANY),
+             ]
+
+    def expected(self):
+        data = self.document['data']
+        result = [(('data', 'title'), data['title']),
+                  (('data', 'r'), data['r']),
+                  (('data', 'count'), data['count']),
+                  (('data', 'ratio'), data['ratio']),
+                  (('data', 'flags'), data['flags']),
+                  ]
+        result.extend((('data', 'issues', index), issue) for index, issue in enumerate(data['issues']))
+        return result
+
+    def parse(self, content, chunk_size):
+        return list(jsonstream.iterparse(_chunked(content, chunk_size), self.paths))
+
+    def test_chunk_boundaries(self):
+        for indent in (None, 2):
+            content = json.dumps(self.document, ensure_ascii=False, indent=indent).encode('utf-8')
+            # Every chunk size below 8 splits keys, numbers, escapes and multibyte characters
+            for chunk_size in (1, 2, 3, 5, 7, 64, len(content)):
+                self.assertEqual(self.parse(content, chunk_size), self.expected(),
+                                 'chunk size {0}, indent {1}'.format(chunk_size, indent))
+
+    def test_escapes(self):
+        content = json.dumps(self.document).encode('utf-8')
+        self.assertEqual(self.parse(content, 3), self.expected())
+
+        content = b'{"a\\"b": {"x": "\\\\"}, "c": "\\u0442\\u0435\\u0441\\u0442"}'
+        items = list(jsonstream.iterparse(_chunked(content, 1), [('a"b', 'x'), ('c',)]))
+        self.assertEqual(items, [(('a"b', 'x'), '\\'), (('c',), 'тест')])
+
+    def test_skipped_values(self):
+        content = json.dumps(self.document).encode('utf-8')
+        items = list(jsonstream.iterparse(_chunked(content, 4), [('data', 'issues', 19, 'id')]))
+        self.assertEqual(items, [(('data', 'issues', 19, 'id'), 19)])
+
+        items = list(jsonstream.iterparse(_chunked(content, 4), [('missing',)]))
+        self.assertEqual(items, [])
+
+    def test_truncated(self):
+        content = json.dumps(self.document).encode('utf-8')
+        for end in (1, 10, len(content) // 3, len(content) // 2, len(content) - 30, len(content) - 1):
+            for chunk_size in (1, 7, len(content)):
+                with self.assertRaises(jsonstream.JSONStreamError):
+                    self.parse(content[:end], chunk_size)
+
+    def test_empty_containers(self):
+        content = b'{"data": {"issues": [], "r": {}, "title": ""}}'
+        items = list(jsonstream.iterparse(_chunked(content, 2), self.paths))
+        self.assertEqual(items, [(('data', 'r'), {}), (('data', 'title'), '')])
+
+
+class SnapshotTestCase(unittest.TestCase):
+
+    data = {'issue_count': 2,
+            'issues': snapshot.project_issues([make_issue('prog', 0), make_issue('prog', 1)]),
+            'menu': [('Play all parts', 'RunPlugin()')],
+            }
+
+    def test_round_trip(self):
+        self.assertEqual(snapshot.loads(snapshot.dumps(self.data)), self.data)
+
+    def test_other_header(self):
+        content = snapshot.dumps(self.data)
+        self.assertIsNone(snapshot.loads(b'XXXX' + content[4:]))
+        self.assertIsNone(snapshot.loads(b''))
+
+        # Written by the next schema version
+        next_schema = bytearray(content)
+        next_schema[len(snapshot._magic)] = snapshot.SCHEMA_VERSION + 1
+        self.assertIsNone(snapshot.loads(bytes(next_schema)))
+
+        # Written by another interpreter
+        with mock.patch.object(snapshot, '_header', snapshot._header[:-1] + b'\xff'):
+            self.assertIsNone(snapshot.loads(content))
+
+    def test_damaged(self):
+        content = snapshot.dumps(self.data)
+        for end in (len(snapshot._header), len(content) // 2, len(content) - 1):
+            self.assertIsNone(snapshot.loads(content[:end]), end)
+
+        self.assertIsNone(snapshot.loads(snapshot._header + b'\xff\xfe\xfd'))
+
+
+class ShiftedStubData(StubData):
+    """Archive of issues ``first``..``first + issues - 1``"""
+
+    def __init__(self, first=0, **kwargs):
+        StubData.__init__(self, **kwargs)
+        self.first = first
+
+    def archive(self, prog_id, archive_id, offset, limit):
+        result = StubData.archive(self, prog_id, archive_id, offset, limit)
+        result['data']['archive']['issues'] = [make_issue(prog_id, self.first + int(issue['title'].split()[-1]))
+                                               for issue in result['data']['archive']['issues']]
+        return result
+
+
+class ArchiveSyncTestCase(unittest.TestCase):
+
+    prog_id = 'prog_1_1'
+
+    def setUp(self):
+        self.data = ShiftedStubData(issues=250)
+        self.server = StubServer(self.data).start()
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.cache_dir, True)
+
+    def visit(self, stream=False):
+        """Video ids of the archive and the archive requests it took"""
+        # Refreshing clients skip fresh HTTP cache entries but keep the archive store
+        api = ntv.NTV({'api_url': self.server.api_url,
+                       'cache_dir': self.cache_dir,
+                       'stream_json': True,
+                       'refresh': True,
+                       })
+
+        self.server.requests[:] = []
+        result = api.browse_episodes(self.prog_id, 1, {'stream': stream})
+        video_ids = [episode['id'] for episode in result['list']]
+
+        return video_ids, len([path for path in self.server.requests if '/archive/' in path])
+
+    def change_archive(self, issues, first=None):
+        self.data.issues = issues
+        if first is not None:
+            self.data.first = first
+        self.server.reset()
+
+    def expected(self):
+        return [make_issue(self.prog_id, index)['video_list'][0]['id']
+                for index in range(self.data.first, self.data.first + self.data.issues)]
+
+    def check_delta(self, newest_first):
+        self.data.newest_first = newest_first
+
+        video_ids, requests = self.visit()
+        self.assertEqual(video_ids, self.expected())
+        self.assertEqual(requests, 3)
+
+        self.change_archive(253)
+        video_ids, requests = self.visit()
+        self.assertEqual(video_ids, self.expected())
+        # The first page and, for oldest-first archives, the page with the new issues
+        self.assertEqual(requests, 1 if newest_first else 2)
+
+        # Unchanged, oldest-first archives need the last page to check for a gap
+        video_ids, requests = self.visit()
+        self.assertEqual(video_ids, self.expected())
+        self.assertEqual(requests, 1 if newest_first else 2)
+
+    def test_delta_newest_first(self):
+        self.check_delta(True)
+
+    def test_delta_oldest_first(self):
+        self.check_delta(False)
+
+    def test_streamed_first_visit(self):
+        video_ids, requests = self.visit(stream=True)
+        self.assertEqual(video_ids, self.expected())
+
+        self.change_archive(260)
+        video_ids, requests = self.visit(stream=True)
+        self.assertEqual(video_ids, self.expected())
+        self.assertEqual(requests, 1)
+
+    def test_shrinking_archive(self):
+        self.visit()
+
+        self.change_archive(240)
+        video_ids, requests = self.visit()
+        self.assertEqual(video_ids, self.expected())
+        self.assertEqual(requests, 3)
+
+    def test_missing_overlap(self):
+        self.visit()
+
+        # Three issues more, but none of the known ones at the newest end
+        self.change_archive(253, first=10)
+        video_ids, requests = self.visit()
+        self.assertEqual(video_ids, self.expected())
+        self.assertEqual(requests, 3)
+
+        self.data.newest_first = False
+        self.change_archive(256, first=20)
+        video_ids, requests = self.visit()
+        self.assertEqual(video_ids, self.expected())
+        self.assertEqual(requests, 4)
+
+    def test_delta_indexes_new_issues(self):
+        indexed = []
+        add = SearchIndex.add
+
+        def counting_add(index, kind, items):
+            items = list(items)
+            indexed.append(len(items))
+            add(index, kind, items)
+
+        with mock.patch.object(SearchIndex, 'add', counting_add):
+            self.visit()
+            self.change_archive(251)
+            self.visit()
+
+        self.assertEqual(indexed, [250, 1])
+
+    def test_search_index_errors(self):
+        error = sqlite3.OperationalError('database is locked')
+        with mock.patch.object(SearchIndex, 'add', side_effect=error):
+            video_ids, requests = self.visit()
+
+        self.assertEqual(video_ids, self.expected())
+
+
+class StreamedIssuesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.api = ntv.NTV({'cache_dir': self.cache_dir})
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, True)
+
+    def test_broken_api_order(self):
+        pages = [[make_issue('prog', index) for index in page]
+                 for page in ([1, 2], [10, 11], [5, 6], [3, 20])]
+        archive = {'issue_count': 8,
+                   'issues': pages[0],
+                   }
+
+        key = FileCache.make_key('prog', 1)
+        with mock.patch.object(self.api, '_archive_pages', return_value=iter(pages)):
+            issues = list(self.api._stream_to_archive(key, {'prog_id': 'prog', 'archive_id': 1}, archive))
+
+        # Issues yielded before the order broke are not merged with the rest
+        self.assertEqual([issue['title'] for issue in issues],
+                         ['Issue {0}'.format(index) for index in (1, 2, 10, 11, 3, 5, 6, 20)])
+
+        store = snapshot.loads(self.api._archives.get(key)[1])
+        self.assertEqual([issue['title'] for issue in store['issues']],
+                         ['Issue {0}'.format(index) for index in (1, 2, 3, 5, 6, 10, 11, 20)])
+
+
+class WorkersTestCase(unittest.TestCase):
+
+    @staticmethod
+    def slow_square(item):
+        # Later items finish first
+        time.sleep(0.002 * (10 - item))
+        if item in (3, 5):
+            raise ntv.NTVApiError('Item {0}'.format(item))
+        return item * item
+
+    def test_order(self):
+        for count in (1, 2, 10):
+            result = list(workers.imap(lambda item: time.sleep(0.002 * (10 - item)) or item, range(count), 4))
+            self.assertEqual(result, list(range(count)))
+
+    def test_first_error(self):
+        for pool in (1, 4):
+            results = []
+            with self.assertRaises(ntv.NTVApiError) as context:
+                for result in workers.imap(self.slow_square, range(10), pool):
+                    results.append(result)
+
+            self.assertEqual('{0}'.format(context.exception), 'Item 3')
+            self.assertEqual(results, [0, 1, 4])
+
+            with self.assertRaises(ntv.NTVApiError) as context:
+                workers.map(self.slow_square, range(10), pool)
+            self.assertEqual('{0}'.format(context.exception), 'Item 3')
+
+
+class FileLockTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.lock_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.lock_dir, 'key.lock')
+
+    def tearDown(self):
+        shutil.rmtree(self.lock_dir, True)
+
+    def test_acquire(self):
+        lock = FileLock(self.path)
+        other = FileLock(self.path)
+        self.assertTrue(lock.acquire())
+        self.assertFalse(other.acquire())
+        self.assertFalse(other.is_free())
+
+        # Only the owner removes the lock file
+        other.release()
+        self.assertFalse(other.acquire())
+
+        lock.release()
+        self.assertTrue(other.is_free())
+        self.assertTrue(other.acquire())
+        other.release()
+
+    def test_wait(self):
+        lock = FileLock(self.path)
+        lock.acquire()
+        other = FileLock(self.path)
+
+        start = time.time()
+        self.assertFalse(other.wait(0.1, 0.01))
+        self.assertGreaterEqual(time.time() - start, 0.1)
+
+        timer = threading.Timer(0.1, lock.release)
+        timer.start()
+        self.assertTrue(other.wait(5, 0.01))
+        timer.join()
+
+    def test_stale_break(self):
+        FileLock(self.path).acquire()
+
+        lock = FileLock(self.path, stale_after=60)
+        self.assertFalse(lock.acquire())
+
+        # Left behind by a process that died two minutes ago
+        past = time.time() - 120
+        os.utime(self.path, (past, past))
+        self.assertTrue(lock.acquire())
+        lock.release()
+        self.assertFalse(os.path.exists(self.path))
+
+        FileLock(self.path).acquire()
+        os.utime(self.path, (past, past))
+        self.assertTrue(FileLock(self.path).wait(0))
+
+
+class StubTestCase(unittest.TestCase):
+    """Test case with a stub server and a cache directory"""
+
+    def setUp(self):
+        self.server = StubServer(StubData(genres=4, programs=25, issues=250)).start()
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.cache_dir, True)
+
+    def make_api(self, **params):
+        params.setdefault('api_url', self.server.api_url)
+        params.setdefault('cache_dir', self.cache_dir)
+        return ntv.NTV(params)
+
+    @staticmethod
+    def fetch_states(api):
+        """List receiving the cache states of the fetches of the api"""
+        states = []
+        api.profiler.add_hook(lambda event: states.append(event['cache']) if event['stage'] == 'fetch' else None)
+        return states
+
+    def requested(self, part):
+        return len([path for path in self.server.requests if part in path])
+
+
+class FileCacheTestCase(StubTestCase):
+
+    def test_lru_eviction(self):
+        path = os.path.join(self.cache_dir, 'lru')
+        body = b'x' * 1000
+        cache = FileCache(path, 4500)
+        for index in range(4):
+            cache.set('key{0}'.format(index), body)
+
+        # key0 is the oldest entry, but it is read last
+        now = time.time()
+        for index in range(4):
+            file_path = cache._file_path('key{0}'.format(index))
+            os.utime(file_path, (now - 100 + index, now - 100 + index))
+        self.assertIsNotNone(cache.get('key0'))
+
+        cache.set('key4', body)
+        self.assertIsNone(cache.get('key1'))
+        for key in ('key0', 'key2', 'key3', 'key4'):
+            self.assertIsNotNone(cache.get(key), key)
+
+        # Writes of other instances are seen by the next scan
+        other = FileCache(path, 4500)
+        other.set('key5', body)
+        self.assertEqual(len(os.listdir(path)), 4)
+
+    def test_etag_revalidation(self):
+        first = self.make_api().get_video_info(5)
+
+        api = self.make_api(refresh=True)
+        states = self.fetch_states(api)
+        self.assertEqual(api.get_video_info(5), first)
+        self.assertEqual(states, ['revalidated'])
+        self.assertEqual(self.requested('/v/5'), 2)
+
+    @staticmethod
+    def seasons(api):
+        result = api.browse_seasons(1001)
+        result['list'] = list(result['list'])
+        return result
+
+    def test_stale_revalidation(self):
+        first = self.seasons(self.make_api())
+
+        # The program page is 50 minutes old, past its ttl of 30 minutes
+        cache = FileCache(os.path.join(self.cache_dir, 'http'))
+        key = FileCache.make_key('program', {'prog_id': 1001}, {})
+        cache.update_meta(key, stored=time.time() - 3000)
+
+        api = self.make_api(max_stale=1800)
+        states = self.fetch_states(api)
+        self.assertEqual(self.seasons(api), first)
+        self.assertEqual(states, ['stale'])
+        self.assertEqual(self.requested('/prog/1001'), 1)
+
+        # Past max_stale it is not served without a request
+        self.assertEqual(self.seasons(self.make_api(max_stale=600)), first)
+        self.assertEqual(self.requested('/prog/1001'), 2)
+        cache.update_meta(key, stored=time.time() - 3000)
+
+        revalidate_start = time.time()
+        api.revalidate_stale()
+        self.assertEqual(states, ['stale', 'revalidated'])
+        self.assertEqual(self.requested('/prog/1001'), 3)
+        self.assertGreaterEqual(cache.get(key)[0]['stored'], revalidate_start)
+
+        api = self.make_api()
+        states = self.fetch_states(api)
+        self.assertEqual(self.seasons(api), first)
+        self.assertEqual(states, ['hit'])
+
+
+class SingleFlightTestCase(StubTestCase):
+    """Requests of a url another process is fetching"""
+
+    @property
+    def video_url(self):
+        return self.server.data.video(5)['info']['video']
+
+    def hold_lock(self, api, release_after=None):
+        """Lock the video 5 request as the other process does, which
+        stores the response before releasing the lock"""
+        key = FileCache.make_key('video', {'video_id': 5}, {})
+        lock = api._get_lock(key)
+        self.assertTrue(lock.acquire())
+
+        def store_response():
+            content = json.dumps(self.server.data.video(5)).encode('utf-8')
+            FileCache(os.path.join(self.cache_dir, 'http')).set(key, content)
+            lock.release()
+
+        if release_after is not None:
+            timer = threading.Timer(release_after, store_response)
+            timer.start()
+            self.addCleanup(timer.join)
+        self.addCleanup(lock.release)
+
+    def test_shared_response(self):
+        api = self.make_api()
+        states = self.fetch_states(api)
+        self.hold_lock(api, 0.2)
+
+        self.assertEqual(api.get_video_info(5)['video'], self.video_url)
+        self.assertEqual(states, ['shared'])
+        self.assertEqual(self.requested('/v/5'), 0)
+
+    def test_lock_timeout(self):
+        api = self.make_api(lock_timeout=0.2)
+        states = self.fetch_states(api)
+        self.hold_lock(api)
+
+        self.assertEqual(api.get_video_info(5)['video'], self.video_url)
+        self.assertEqual(states, ['miss'])
+        self.assertEqual(self.requested('/v/5'), 1)
+
+    @unittest.skipUnless(ntv.PY3, 'asyncio client needs Python 3')
+    def test_async_shared_response(self):
+        from resources.lib import asyncntv
+
+        api = self.make_api()
+        states = self.fetch_states(api)
+        self.hold_lock(api, 0.2)
+
+        self.assertEqual(asyncntv.run(api, 'get_video_info', 5)['video'], self.video_url)
+        self.assertEqual(states, ['shared'])
+        self.assertEqual(self.requested('/v/5'), 0)
+
+    @unittest.skipUnless(ntv.PY3, 'asyncio client needs Python 3')
+    def test_async_lock_timeout(self):
+        from resources.lib import asyncntv
+
+        api = self.make_api(lock_timeout=0.2)
+        states = self.fetch_states(api)
+        self.hold_lock(api)
+
+        self.assertEqual(asyncntv.run(api, 'get_video_info', 5)['video'], self.video_url)
+        self.assertEqual(states, ['miss'])
+        self.assertEqual(self.requested('/v/5'), 1)
+
+
+class ProgramPagesTestCase(StubTestCase):
+
+    def test_bad_cursors(self):
+        api = self.make_api()
+        for cursor in ('abc', '10', '10.x', '0.1', '10.-1', '1.2.3'):
+            with self.assertRaises(ntv.NTVApiError):
+                api.browse_programs(0, {'cursor': cursor})
+
+    def test_cursor_page_turn(self):
+        api = self.make_api()
+        genre_id = api.get_genre_id('Genre 2')
+        result = api.browse_programs(genre_id, {'limit': 10})
+        first_page = [program['shortcat'] for program in result['list']]
+        self.assertEqual(first_page, ['prog_2_{0}'.format(index) for index in range(10)])
+
+        cursor = result['next_cursor']
+        self.server.requests[:] = []
+        for page_no in range(1, 3):
+            api = self.make_api()
+            states = self.fetch_states(api)
+            genre_id = api.get_genre_id('Genre 2')
+            result = api.browse_programs(genre_id, {'cursor': cursor})
+
+            self.assertEqual([program['shortcat'] for program in result['list']],
+                             ['prog_2_{0}'.format(index) for index in range(page_no * 10, min(page_no * 10 + 10, 25))])
+            self.assertEqual(states, [])
+            cursor = result['next_cursor']
+
+        self.assertIsNone(cursor)
+        self.assertEqual(self.server.requests, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
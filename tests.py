@@ -77,6 +77,18 @@ def test_05_video():
 
         run_script()
 
+    @staticmethod
+    @mock.patch('simpleplugin.sys.argv', ['plugin://{0}/search?keyword=Береговая'.format(addon_name), '6', ''])
+    def test_06_search():
+
+        run_script()
+
+    @staticmethod
+    @mock.patch('simpleplugin.sys.argv', ['plugin://{0}/parts/829700'.format(addon_name), '7', ''])
+    def test_07_parts():
+
+        run_script()
+
 
 
 if __name__ == '__main__':